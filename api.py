@@ -1,93 +1,81 @@
+import logging
 import uvicorn 
-import requests
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.websockets import WebSocketState
 from typing import Optional, Dict, Any , List,Set
 from utils.models import (
-    MessagePayload
+    MessagePayload,
+    Subscription
     )
-from config import VideoConfig, ServerConfig
+from pydantic import ValidationError
+from utils.broadcast import broadcaster, hub
+from config import BroadcastConfig, VideoConfig, ServerConfig
 
-# FastAPI应用配置 
-app = FastAPI(title="SenseAct AI 实时感知")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 多 worker 时通过 pub/sub 频道把消息转发给所有 worker
+    await hub.start()
+    yield
+    await hub.stop()
 
-# 用于存储当前连接的 WebSocket 客户端
-connected_websockets: Set[WebSocket] = set()
+# FastAPI应用配置 
+app = FastAPI(title="SenseAct AI 实时感知", lifespan=lifespan)
 
 @app.websocket("/ws/notify")
 async def websocket_endpoint(websocket: WebSocket):
     """
     WebSocket 端点，处理客户端连接和断开。
-    后端只发送消息，不接收。
+    客户端发送的 JSON 作为订阅条件（见 Subscription），例如
+        {"devices": ["device_123456"], "types": ["event", "alarm"], "min_alarm": 0.5, "thumbnail": false}
+    未发送或缺少的字段表示不过滤。消息由 broadcaster 中该客户端的写任务发送。
     """
     await websocket.accept()
-    # 将新的连接添加到集合中
-    connected_websockets.add(websocket)
-    print(f"WebSocket accepted: {websocket}")
+    # 注册客户端，启动它的写任务
+    client = broadcaster.register(websocket)
+    print(f"WebSocket accepted: {websocket.client}")
 
     try:
-        # 这个循环是为了保持连接开放。因为我们只推送，所以这里只等待断开。
-        # 实际上，你可以省略这个接收循环，但为了优雅地处理断开，保留它比较好。
-        # 任何从客户端发来的消息都会触发 WebSocketDisconnect 异常。
+        # 接收订阅消息并保持连接，客户端断开（或因过慢被断开）时循环结束。
         while True:
-            # 后端不接收消息，所以我们只是等待任何客户端活动（例如断开）
-            # 如果客户端发送消息，这里会捕获到并触发异常或处理
-            # 但在这个例子中，我们只关注连接的保持和断开
             data = await websocket.receive_text()
-            # Optional: Log received data if you ever wanted to inspect
-            # print(f"Received data (will be ignored): {data}")
+            try:
+                broadcaster.subscribe(client, Subscription.model_validate_json(data))
+                print(f"WebSocket {websocket.client} subscribed: {client.subscription}")
+            except ValidationError as e:
+                print(f"Invalid subscription from {websocket.client} (ignored): {e}")
 
     except WebSocketDisconnect:
         # 客户端断开连接
-        connected_websockets.remove(websocket)
-        print(f"WebSocket disconnected: {websocket}")
+        print(f"WebSocket disconnected: {websocket.client}")
     except Exception as e:
         # 处理其他可能的异常
-        print(f"WebSocket error with {websocket}: {e}")
-        if websocket in connected_websockets:
-             connected_websockets.remove(websocket)
+        print(f"WebSocket error with {websocket.client}: {e}")
+    finally:
+        broadcaster.unregister(client)
 
 
 
 
 @app.post("/sendjson")
 async def send_json_message(payload: MessagePayload):
-    # 将 Pydantic 模型对象转换为字典，再转换为 JSON 字符串
-    message_to_send = payload.model_dump_json()
-
-    print(f"Attempting to send JSON message to {len(connected_websockets)} clients")
-    # 异步地向所有连接的客户端发送消息
-    await send_message_to_clients(message_to_send)
+    # 发布给所有 worker，各 worker 只放入订阅了该消息的客户端的发送队列，不等待发送完成
+    await hub.publish([payload])
 
-    return {"status": "JSON message sent", "data": message_to_send}
+    return {"status": "JSON message queued"}
 
-async def send_message_to_clients(message: str):
-    """
-    向所有连接的 WebSocket 客户端发送消息。
-    """
-    # 创建一个列表副本，以防在迭代时集合被修改（客户端断开）
-    disconnected_clients = []
-    for client in list(connected_websockets):
-        try:
-            # WebSocket 连接是异步的，使用 await 发送
-            await client.send_text(message)
-            print(f"Sent message to {client}")
-        except RuntimeError as e:
-            # 客户端可能已经断开，但在集合中还没移除
-            print(f"Error sending to {client}: {e}. Marking for removal.")
-            disconnected_clients.append(client)
-        except Exception as e:
-             print(f"Unexpected error sending to {client}: {e}. Marking for removal.")
-             disconnected_clients.append(client)
+@app.post("/sendjson/bulk")
+async def send_json_messages(payloads: List[MessagePayload]):
+    """批量接收通知（utils.notifier 发送），按顺序放入所有客户端的发送队列。"""
+    await hub.publish(payloads)
 
-    # 移除发送失败的客户端
-    for client in disconnected_clients:
-        if client in connected_websockets:
-            connected_websockets.remove(client)
-            print(f"Removed disconnected client {client}")
+    return {"status": "JSON messages queued", "count": len(payloads)}
 
 
 if __name__ == "__main__":
+    if ServerConfig.WORKERS > 1 and not BroadcastConfig.BACKPLANE_URL:
+        # 没有 pub/sub 频道时每个 worker 只推送自己收到的消息
+        logging.warning(f"ServerConfig.WORKERS is {ServerConfig.WORKERS} but no BroadcastConfig.BACKPLANE_URL is set: "
+                        "each client only receives messages posted to its own worker")
     uvicorn.run( 
         app="api:app",
         host=ServerConfig.HOST,
@@ -1,6 +1,7 @@
 from typing import Dict, Any
 import logging
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,9 +11,27 @@ IP = os.getenv('IP')
 
 # 视频处理配置
 class VideoConfig:
-    FRAME_INTERVAL = 10  # 分析间隔(秒)
+    FRAME_INTERVAL = 10  # 分析间隔(帧)
+    FRAME_INTERVAL_SEC = 0  # 分析间隔(秒)，大于0时按时间抽帧，覆盖 FRAME_INTERVAL
+    SEEK_MIN_INTERVAL = 60  # 抽帧间隔(帧)不小于该值时直接 seek 到目标帧，不再逐帧 grab
     SCALE = 0.25 # 缩略图缩放比例
-    SIMILARITY_THRESHOLD = 0.8 # 相似度阈值，数值越小抽取的帧越少
+    CHANGE_METRIC = "ssim" # 关键帧检测方法：ssim(窗口SSIM) / mad(平均绝对差) / phash(感知哈希)
+    # 各检测方法的相似度阈值，相似度低于阈值时为关键帧，数值越小抽取的帧越少。各方法的刻度不同：
+    # ssim: 窗口 SSIM 均值，0.8 约为明显的局部结构变化
+    # mad: 1 - 平均绝对差/255，0.95 表示平均每个像素相差超过约 13 个灰度级
+    # phash: 1 - 汉明距离/64，0.85 表示 64 位哈希中超过约 10 位不同
+    SIMILARITY_THRESHOLDS = {"ssim": 0.8, "mad": 0.95, "phash": 0.85}
+    DETECT_WIDTH = 160 # 关键帧检测前将帧缩放到的宽度(灰度)
+    QUEUE_SIZE = 4 # 帧处理流水线各阶段之间的队列长度
+    SESSION_MAX_GAP = 60 # 同一设备相邻片段间隔超过该值(秒)时不再与上一片段的关键帧比较
+    MAX_SESSIONS = 256 # 保留关键帧检测状态的设备数，超出时丢弃最久未使用的设备
+
+
+# 视频片段并发处理配置
+class IngestConfig:
+    MAX_CONCURRENCY = 8  # 同时处理的视频片段数
+    MAX_PENDING = 16  # 已读取但未处理完的片段上限，达到后暂停读取流
+    DECODE_WORKERS = os.cpu_count() or 4  # 解码线程数
 
 
 # API配置
@@ -25,6 +44,10 @@ class LLMConfig:
     # API请求配置    
     TEMPERATURE = 0.5 # 温度
     MAXTOKENS = 1024 # 最大token数
+    IMAGE_SCALE = 0.25 # 发送给模型的图片缩放比例，与 VideoConfig.SCALE 相同时复用缩略图编码结果
+    BATCH_SIZE = 4 # 同一设备的关键帧最多合并为一个请求的图片数，1 表示不合并
+    BATCH_WINDOW = 0.5 # 合并等待时间(秒)，超时后不足 BATCH_SIZE 也发送
+    BATCHER_IDLE_TTL = 10*60 # 设备没有待分析的关键帧超过该时间(秒)后释放其合并器
 
     PROMPT = """You are an advanced image analysis assistant specializing in extracting precise data from video and images captured by a home security camera.
 Your task is to analyze video or images and summary the key events as detail as possible. 
@@ -41,6 +64,23 @@ Output json as below:
 - `event_category`: string, 事件类型，包括 火灾,异常停留,⼊侵检测,⼈员跌倒,包裹投递,⽆事件,其它.
 - `trigger_alarm`: float, a value between 0 and 1, indicating whether an abnormal situation that requires notification has occurred, with 1 indicating the most serious abnormality.
 - `is_new_event`: 1 or 0, a boolean value indicating whether the event is a new event compared to the previous event.
+"""
+
+    BATCH_PROMPT = """You are an advanced image analysis assistant specializing in extracting precise data from video and images captured by a home security camera.
+You will receive {count} images in chronological order, each one a key frame from the same camera.
+Analyze each image separately and summary the key events as detail as possible. 
+Focus on identifying and describing the actions of people, pet and dynamic objects (e.g., vehicles) rather than static background details. 
+
+Provide only json output, with no additional text or commentary. 
+
+Context about previous events:
+{previous_events}
+
+Output a json array with exactly {count} objects, one per image in the same order, each as below:
+- `description`:string, summary of the event in short Chinese sentence.
+- `event_category`: string, 事件类型，包括 火灾,异常停留,⼊侵检测,⼈员跌倒,包裹投递,⽆事件,其它.
+- `trigger_alarm`: float, a value between 0 and 1, indicating whether an abnormal situation that requires notification has occurred, with 1 indicating the most serious abnormality.
+- `is_new_event`: 1 or 0, a boolean value indicating whether the event is a new event compared to the previous image.
 """
 
 class SummaryLLMConfig:
@@ -64,10 +104,78 @@ Output json as below:
 - `event_summary`: string, summary of the event in longer Chinese sentence.
 """
 
+# LLM 客户端连接池配置
+class LLMClientConfig:
+    FAKE_LLM_URL = "http://localhost:8088/fakellm"
+    MAX_CONNECTIONS = 32 # 每个 endpoint 的最大连接数
+    MAX_KEEPALIVE = 16 # 每个 endpoint 保持的空闲连接数
+    KEEPALIVE_EXPIRY = 30 # 空闲连接保持时间(秒)
+    HTTP2 = True # 安装 h2 时启用 HTTP/2
+    TIMEOUT = 120 # 请求超时(秒)
+
+# LLM 请求调度配置（AIMD 自适应并发）
+class LLMSchedulerConfig:
+    INITIAL_LIMIT = 4 # 初始并发数
+    MIN_LIMIT = 1 # 最小并发数
+    MAX_LIMIT = 32 # 最大并发数
+    LATENCY_TARGET = 10 # 目标延迟(秒)，超过视为拥塞并降低并发
+    BACKOFF = 0.7 # 拥塞或出错时并发数乘以该系数
+    ALARM_THRESHOLD = 0.5 # 设备最近一次 trigger_alarm 达到该值时，其关键帧优先分析（同一进程内）
+    SUMMARY_MAX_LIMIT = 2 # 总结进程（main_sum.py）的最大并发数，它与实时分析进程不共享调度器
+
+# LLM 结果缓存配置（按帧感知哈希复用相同画面的分析结果）
+class LLMCacheConfig:
+    ENABLED = True
+    MAX_SIZE = 1024 # 最多缓存条数，LRU 淘汰
+    TTL = 10*60 # 缓存有效期(秒)
+    MAX_DISTANCE = 4 # 感知哈希汉明距离不超过该值视为相同画面，0 表示只匹配完全相同的哈希
+    PERSIST_PATH = None # SQLite 文件路径，例如 "llm_cache.db"，None 表示只缓存在内存
+
 class SummaryConfig:
     MAX_GAP_LENGTH = 1*60*1000  # 1分钟内没有相同事件，就开始总结    
     MAX_TIME_LENGTH = 2*60*1000 # 事件长度超过10分钟，不管后面是不是同一事件，就开始总结
 
+# 数据库配置
+class DBConfig:
+    PATH = 'data.db'
+    BATCH_SIZE = 200 # 每个事务最多写入的语句数
+    FLUSH_INTERVAL = 0.5 # 合并写入的最长等待时间(秒)
+    QUEUE_SIZE = 10000 # 写入队列长度，满时写入方等待
+    BUSY_TIMEOUT = 5000 # 数据库被锁时的等待时间(毫秒)
+    CACHE_SIZE_KB = 16*1024 # 页缓存大小(KB)
+    CACHED_STATEMENTS = 128 # 每个连接缓存的预编译语句数
+
+# KV 存储配置
+class KVConfig:
+    URL = os.getenv('KV_URL') # 例如 redis://127.0.0.1:6390（python -m fakeredis.server 或真实 Redis），为空时使用本地文件 LocalRedis
+
+# 视频片段消息流配置
+class StreamConfig:
+    STORAGE_PATH = "my_local_streams" # fakestreaming 下的本地存储目录
+    STREAM_ID = "ocid1.stream.oc1..exampleuniqueID"
+    PARTITIONS = 4 # 新建 stream 的分区数，消息按 device_id 分区
+    GROUP_NAME = "video-ingest" # 视频分析进程共用的消费组，分区在组内各进程之间分配
+    INSTANCE_NAME = os.getenv('STREAM_INSTANCE') or f"{socket.gethostname()}-{os.getpid()}" # 组内实例名，各进程唯一
+    POLL_LIMIT = 2 # 每次读取的消息数
+    POLL_TIMEOUT = 2 # 没有消息时每次读取最多阻塞的时间(秒)，新消息到达时立即返回
+    SESSION_TIMEOUT = 30 # 超过该时间(秒)没有读取或心跳的实例被移出消费组，分区分配给其它实例
+    HEARTBEAT_INTERVAL = 5 # 后台发送心跳并提交已处理位置的间隔(秒)，应远小于 SESSION_TIMEOUT
+
+# 视频片段下载配置：片段先下载到本地缓存再解码
+class FetchConfig:
+    ENABLED = True # False 时 OpenCV 直接从对象存储流式读取
+    OBJECT_STORAGE_URL = os.getenv('OBJECT_STORAGE_URL') # 为空时使用 https://objectstorage.{region}.oraclecloud.com；本地测试可设为 fakeapi 地址 http://127.0.0.1:8088
+    CACHE_PATH = os.getenv('SEGMENT_CACHE_PATH', 'segment_cache') # 本地缓存目录，可设为 tmpfs，例如 /dev/shm/segment_cache
+    CACHE_MAX_BYTES = 512*1024*1024 # 缓存上限，超出时删除最久未使用且已处理完的片段
+    MAX_DOWNLOADS = 4 # 同时下载的片段数
+    PART_SIZE = 1024*1024 # Range 请求的分块大小
+    RANGE_PARTS = 4 # 每个片段同时进行的 Range 请求数
+    TIMEOUT = 60 # 下载请求超时(秒)，下载使用单独的连接池，连接数为 MAX_DOWNLOADS*RANGE_PARTS
+
+# 缩略图存储配置，数据库中只保存缩略图哈希
+class BlobConfig:
+    PATH = os.getenv('BLOB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thumbnails')) # 缩略图目录，文件名为 JPEG 内容的 sha256，默认为项目目录下的 thumbnails
+
 # 服务器配置
 class ServerConfig:
     HOST = "127.0.0.1"
@@ -75,6 +183,37 @@ class ServerConfig:
     RELOAD = False
     WORKERS = 1
 
+# 事件通知发送配置（video_server -> api.py）
+class NotifyConfig:
+    URL = f"http://{ServerConfig.HOST}:{ServerConfig.PORT}/sendjson/bulk" # 批量通知接口
+    BATCH_SIZE = 16 # 每个请求最多包含的通知数
+    BATCH_WINDOW = 0.05 # 凑批的最长等待时间(秒)
+    QUEUE_SIZE = 1000 # 待发送队列长度
+    OVERFLOW = "coalesce" # 队列满时的处理：coalesce(替换同一设备同一类型的旧通知，没有则丢弃最旧的普通通知) / drop_oldest / drop_new
+    ALARM_THRESHOLD = 0.5 # triger_alarm 不低于该值（或 type 为 alarm）的通知在队列满时优先保留
+    MAX_RETRIES = 5 # 发送失败的重试次数，之后丢弃该批通知
+    RETRY_BACKOFF = 0.5 # 第一次重试前的等待时间(秒)，之后每次翻倍
+    MAX_BACKOFF = 10 # 重试等待时间上限(秒)
+
+# WebSocket 推送配置（api.py）
+class BroadcastConfig:
+    CLIENT_QUEUE_SIZE = 100 # 每个客户端待发送的消息数上限
+    SLOW_CLIENT = "drop_oldest" # 客户端队列满时：drop_oldest(丢弃最旧的消息) / disconnect(断开该客户端)
+    SEND_TIMEOUT = 10 # 单条消息发送超时(秒)，超时断开客户端
+    BACKPLANE_URL = os.getenv('NOTIFY_BACKPLANE_URL') or KVConfig.URL # 多个 api.py worker 之间转发消息的 pub/sub 服务（fakeredis.server 或 Redis），为空时只推送给本进程的客户端
+    CHANNEL = "notify" # 转发消息使用的频道
+    SEQ_KEY = "notify:seq" # 配置了 BACKPLANE_URL 时，各 worker 共用的消息序号计数器
+    REPLAY_SIZE = 200 # 每个设备保留的最近消息数，客户端重连时带 last_seq 补发
+    REPLAY_DEVICES = 1000 # 保留最近消息的设备数上限，超出时丢弃最久没有消息的设备
+
+# Web UI 配置
+class WebUIConfig:
+    WEBSOCKET_URL = os.getenv("WEBUI_WEBSOCKET_URL", "ws://localhost:16532/ws/notify")
+    WINDOW_SIZE = 100 # 内存中只保留最新的消息数，更早的消息按需从数据库分页加载
+    PAGE_SIZE = 20 # 每次加载的历史消息数
+    THUMBNAIL_CACHE_SIZE = 300 # 解码后的缩略图缓存数（按哈希），应不小于 WINDOW_SIZE
+    WAIT_TIMEOUT = 1.0 # 等待新消息的最长时间（秒），超时后刷新连接状态
+
 # 日志配置
 LOG_CONFIG = {
     'level': logging.INFO,
@@ -1,4 +1,7 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Response
+from typing import Optional
+import os
+import re
 import time
 import json
 import uvicorn
@@ -12,17 +15,54 @@ with open("fakedata.jsonl", "r",encoding="utf-8-sig") as f:
     lines = f.readlines()
 
 @app.get("/fakellm")
-def increment_index():
+def increment_index(n: int = 1):
     # 读取当前索引
     with open("llmindex", "r") as f:
         index = int(f.read())
     time.sleep(2)  # 等待2秒
-    index += 1     # 索引自增
+    results = []
+    for _ in range(n):
+        index += 1     # 索引自增
+        # 对应行内容，去除首尾空白
+        results.append(json.loads(lines[index % len(lines)].strip()))
     # 写回文件
     with open("llmindex", "w") as f:
         f.write(str(index))
-    # 返回对应行内容，去除首尾空白
-    return json.loads(lines[index].strip())
+    # 多图请求返回数组
+    if n > 1:
+        return results
+    return results[0]
+
+# 模拟对象存储的 PAR 下载地址，返回 objects/<object_name> 的内容，支持单个 Range。
+# 视频分析进程设置 OBJECT_STORAGE_URL=http://127.0.0.1:8088 后从这里下载片段。
+OBJECTS_DIR = "objects"
+
+@app.get("/p/{par}/n/{namespace}/b/{bucket}/o/{object_name:path}")
+def get_object(par: str, namespace: str, bucket: str, object_name: str,
+               range: Optional[str] = Header(None)):
+    path = os.path.realpath(os.path.join(OBJECTS_DIR, object_name))
+    if not path.startswith(os.path.realpath(OBJECTS_DIR) + os.sep) or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Object not found")
+    total = os.path.getsize(path)
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range or "")
+    if not match or match.groups() == ("", ""):
+        with open(path, "rb") as f:
+            return Response(f.read(), media_type="application/octet-stream",
+                            headers={"Accept-Ranges": "bytes"})
+    start, end = match.groups()
+    if start == "":
+        # bytes=-N：最后 N 个字节
+        start, end = max(total - int(end), 0), total - 1
+    else:
+        start, end = int(start), min(int(end) if end else total - 1, total - 1)
+    if start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable",
+                            headers={"Content-Range": f"bytes */{total}"})
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start + 1)
+    return Response(data, status_code=206, media_type="application/octet-stream",
+                    headers={"Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{total}"})
 
 if __name__ == "__main__":
     uvicorn.run( 
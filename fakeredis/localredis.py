@@ -1,51 +1,253 @@
+import copy
 import json
 import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 
 class LocalRedis:
     """
     A minimal file-backed key-value store.
-    Supports basic operations: SET, GET, DELETE.
-    Data is persisted as JSON to a local file.
+    Supports basic operations: SET, GET, DELETE, TYPE, HSET, HGET, HGETALL,
+    HDEL, plus HUPDATE for an atomic read-modify-write of one hash field.
+
+    Data is kept in memory. Every write is appended to a log file
+    (`local_redis.aof`, one JSON record per line) and the log is
+    compacted into the JSON snapshot (`local_redis.json`) once it grows
+    past `compact_size` bytes. A lock file serializes access between
+    processes; before each operation the store replays only the log
+    records written by other processes since its last operation, so
+    reads and writes cost O(1) instead of O(number of keys).
     """
 
-    def __init__(self, filename='local_redis.json'):
+    COMPACT_SIZE = 1024 * 1024
+
+    def __init__(self, filename='local_redis.json', compact_size=COMPACT_SIZE):
         current_path = os.path.dirname(os.path.abspath(__file__))
         self.filename = os.path.join(current_path, filename)
-        # Initialize storage file if missing
-        if not os.path.exists(self.filename):
-            with open(self.filename, 'w',encoding='utf-8-sig') as f:
-                json.dump({}, f)
+        base = os.path.splitext(self.filename)[0]
+        self.aof_filename = base + '.aof'
+        self.lock_filename = base + '.lock'
+        self.compact_size = compact_size
+
+        self.data = {}
+        self.generation = None
+        self.offset = 0
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = open(self.lock_filename, 'a+b')
+        with self._locked():
+            # Initialize storage file if missing
+            if not os.path.exists(self.filename):
+                self._write_snapshot({})
+            if not os.path.exists(self.aof_filename):
+                with open(self.aof_filename, 'wb') as f:
+                    f.write(self._encode({"op": "gen", "gen": 0}))
+        self._aof = open(self.aof_filename, 'r+b')
+        with self._locked():
+            self._reload()
+
+    # ---- locking -------------------------------------------------------
+
+    @contextmanager
+    def _locked(self):
+        """Hold the in-process and cross-process lock. Reentrant."""
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+                else:
+                    self._lock_file.seek(0)
+                    msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    if fcntl is not None:
+                        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+                    else:
+                        self._lock_file.seek(0)
+                        msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run several operations atomically, e.g. a read-modify-write:
+
+            with store.transaction():
+                value = store.hget(key, field)
+                store.hset(key, field, new_value)
+        """
+        with self._locked():
+            self._catch_up()
+            yield self
+
+    # ---- persistence ---------------------------------------------------
+
+    @staticmethod
+    def _encode(record):
+        return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
 
     def _load(self):
-        """Load the entire store from disk."""
-        with open(self.filename, 'r',encoding='utf-8-sig') as f:
+        """Load the snapshot from disk."""
+        with open(self.filename, 'r', encoding='utf-8-sig') as f:
             return json.load(f)
 
-    def _save(self, data):
-        """Persist the entire store to disk."""
-        with open(self.filename, 'w',encoding='utf-8-sig') as f:
+    def _write_snapshot(self, data):
+        """Persist the entire store to disk atomically."""
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w', encoding='utf-8-sig') as f:
             json.dump(data, f)
+        os.replace(tmp, self.filename)
+
+    def _read_generation(self):
+        self._aof.seek(0)
+        header = self._aof.readline()
+        try:
+            return json.loads(header)["gen"]
+        except (ValueError, KeyError):
+            return None
+
+    def _reload(self):
+        """Rebuild memory from the snapshot plus the whole log."""
+        self.data = self._load()
+        self.generation = self._read_generation()
+        self.offset = self._aof.tell()
+        self._replay()
+
+    def _replay(self):
+        self._aof.seek(self.offset)
+        while True:
+            line = self._aof.readline()
+            if not line.endswith(b'\n'):
+                # Ignore a partially written trailing record
+                break
+            self._apply(json.loads(line))
+            self.offset = self._aof.tell()
+
+    def _catch_up(self):
+        """Apply records appended by other processes since our last operation."""
+        if self._read_generation() != self.generation:
+            # Another process compacted the log
+            self._reload()
+        else:
+            self._replay()
+
+    def _append(self, record):
+        self._aof.seek(0, os.SEEK_END)
+        self._aof.write(self._encode(record))
+        self._aof.flush()
+        self.offset = self._aof.tell()
+        if self.offset >= self.compact_size:
+            self.compact()
+
+    def compact(self):
+        """Write memory to the snapshot and start a new log generation."""
+        with self._locked():
+            self._catch_up()
+            self._write_snapshot(self.data)
+            self.generation = (self.generation or 0) + 1
+            self._aof.seek(0)
+            self._aof.truncate()
+            self._aof.write(self._encode({"op": "gen", "gen": self.generation}))
+            self._aof.flush()
+            self.offset = self._aof.tell()
+
+    def _apply(self, record):
+        op = record["op"]
+        key = record.get("key")
+        if op == "set":
+            self.data[key] = record["value"]
+        elif op == "del":
+            self.data.pop(key, None)
+        elif op == "hset":
+            self.data.setdefault(key, {})[record["field"]] = record["value"]
+        elif op == "hdel":
+            self.data.get(key, {}).pop(record["field"], None)
+
+    def _write(self, record):
+        self._apply(record)
+        self._append(record)
+
+    # ---- commands ------------------------------------------------------
 
     def set(self, key, value):
         """Set the string value of a key."""
-        data = self._load()
-        data[key] = value
-        self._save(data)
+        with self._locked():
+            self._catch_up()
+            self._write({"op": "set", "key": key, "value": value})
         return True
 
     def get(self, key):
         """Get the value of a key. Returns None if not found."""
-        data = self._load()
-        return data.get(key)
+        with self._locked():
+            self._catch_up()
+            return copy.deepcopy(self.data.get(key))
 
     def delete(self, key):
         """Delete a key. Returns True if deleted, False if key did not exist."""
-        data = self._load()
-        if key in data:
-            del data[key]
-            self._save(data)
-            return True
-        return False
+        with self._locked():
+            self._catch_up()
+            if key in self.data:
+                self._write({"op": "del", "key": key})
+                return True
+            return False
+
+    def type(self, key):
+        """Return 'hash', 'string' or 'none' for a key (like the Redis TYPE command)."""
+        with self._locked():
+            self._catch_up()
+            value = self.data.get(key)
+        if value is None:
+            return 'none'
+        return 'hash' if isinstance(value, dict) else 'string'
+
+    def hset(self, key, field, value):
+        """Set one field of a hash. Returns 1 if the field is new, otherwise 0."""
+        with self._locked():
+            self._catch_up()
+            is_new = field not in self.data.get(key, {})
+            self._write({"op": "hset", "key": key, "field": field, "value": value})
+            return int(is_new)
+
+    def hget(self, key, field):
+        """Get one field of a hash. Returns None if not found."""
+        with self._locked():
+            self._catch_up()
+            return copy.deepcopy(self.data.get(key, {}).get(field))
+
+    def hgetall(self, key):
+        """Get all fields of a hash as a dict (empty if not found)."""
+        with self._locked():
+            self._catch_up()
+            return copy.deepcopy(self.data.get(key, {}))
+
+    def hdel(self, key, field):
+        """Delete one field of a hash. Returns 1 if deleted, otherwise 0."""
+        with self._locked():
+            self._catch_up()
+            if field in self.data.get(key, {}):
+                self._write({"op": "hdel", "key": key, "field": field})
+                return 1
+            return 0
+
+    def hupdate(self, key, field, update):
+        """
+        Atomically replace one hash field with update(old value or None),
+        across processes. Returns the new value.
+        """
+        with self.transaction():
+            value = update(self.hget(key, field))
+            self.hset(key, field, value)
+            return value
 
 # 示例用法
 # if __name__ == '__main__':
@@ -54,3 +256,5 @@ class LocalRedis:
 #     print(store.get('foo'))   # 输出: bar
 #     store.delete('foo')
 #     print(store.get('foo'))   # 输出: None
+#     store.hset('device', 'event', {'min_time': 1, 'max_time': 2})
+#     print(store.hget('device', 'event'))   # 输出: {'min_time': 1, 'max_time': 2}
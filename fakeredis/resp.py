@@ -0,0 +1,333 @@
+import asyncio
+import json
+import socket
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+
+class RespError(Exception):
+    """Error reply (-ERR ...) returned by the server."""
+
+
+class Status(str):
+    """Simple string reply (+OK). Plain str values are always sent as bulk strings."""
+
+
+def encode_command(*args):
+    """Encode a command as a RESP array of bulk strings."""
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        else:
+            data = str(arg).encode('utf-8')
+        parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    return b''.join(parts)
+
+
+def encode_reply(value):
+    """Encode a Python value as a RESP reply."""
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, RespError):
+        return b'-%s\r\n' % str(value).encode('utf-8')
+    if isinstance(value, bool):
+        return b':%d\r\n' % int(value)
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, (list, tuple)):
+        return b'*%d\r\n' % len(value) + b''.join(encode_reply(each) for each in value)
+    if isinstance(value, Status):
+        return b'+%s\r\n' % value.encode('utf-8')
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def _decode_value(data):
+    """Values written by RespClient are JSON; anything else is returned as text."""
+    if data is None:
+        return None
+    text = data.decode('utf-8')
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+class RespClient:
+    """
+    Drop-in replacement for LocalRedis that talks RESP to the local
+    server (python -m fakeredis.server) or to a real Redis.
+
+    Values are stored as JSON strings, so dicts and numbers round-trip
+    like they do with LocalRedis.
+    """
+
+    def __init__(self, host='127.0.0.1', port=6390, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.buffer = b''
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_url(cls, url):
+        parts = urlsplit(url)
+        return cls(host=parts.hostname or '127.0.0.1', port=parts.port or 6379)
+
+    # ---- connection ----------------------------------------------------
+
+    def _connect(self):
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.buffer = b''
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _readline(self):
+        while b'\r\n' not in self.buffer:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("Connection closed by server")
+            self.buffer += chunk
+        line, self.buffer = self.buffer.split(b'\r\n', 1)
+        return line
+
+    def _readexactly(self, n):
+        while len(self.buffer) < n:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("Connection closed by server")
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        return data
+
+    def _read_reply(self):
+        line = self._readline()
+        kind, rest = line[:1], line[1:]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            return RespError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            n = int(rest)
+            if n < 0:
+                return None
+            return self._readexactly(n + 2)[:-2]
+        if kind == b'*':
+            n = int(rest)
+            if n < 0:
+                return None
+            return [self._read_reply() for _ in range(n)]
+        raise RespError(f"Unexpected reply: {line!r}")
+
+    def execute_many(self, commands):
+        """Send several commands in one write (pipelining) and return their replies."""
+        with self._lock:
+            self._connect()
+            try:
+                self.sock.sendall(b''.join(encode_command(*each) for each in commands))
+                return [self._read_reply() for _ in commands]
+            except (OSError, ConnectionError):
+                self.close()
+                raise
+
+    def execute(self, *args):
+        reply = self.execute_many([args])[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    @contextmanager
+    def pipeline(self):
+        """
+        Queue commands and send them together on exit:
+
+            with store.pipeline() as pipe:
+                pipe.append(('HSET', key, field, value))
+                pipe.append(('EXPIRE', key, 60))
+        """
+        commands = []
+        yield commands
+        if commands:
+            for reply in self.execute_many(commands):
+                if isinstance(reply, RespError):
+                    raise reply
+
+    # ---- LocalRedis-compatible commands -----------------------------------
+
+    def set(self, key, value):
+        return self.execute('SET', key, json.dumps(value, ensure_ascii=False)) == 'OK'
+
+    def get(self, key):
+        return _decode_value(self.execute('GET', key))
+
+    def delete(self, key):
+        return self.execute('DEL', key) > 0
+
+    def hset(self, key, field, value):
+        return self.execute('HSET', key, field, json.dumps(value, ensure_ascii=False))
+
+    def hget(self, key, field):
+        return _decode_value(self.execute('HGET', key, field))
+
+    def hgetall(self, key):
+        reply = self.execute('HGETALL', key)
+        return {reply[i].decode('utf-8'): _decode_value(reply[i + 1]) for i in range(0, len(reply), 2)}
+
+    def hdel(self, key, field):
+        return self.execute('HDEL', key, field)
+
+    def expire(self, key, seconds):
+        return self.execute('EXPIRE', key, int(seconds)) == 1
+
+    def type(self, key):
+        reply = self.execute('TYPE', key)
+        return reply.decode('utf-8') if isinstance(reply, bytes) else reply
+
+    def hupdate(self, key, field, update):
+        """
+        Atomically replace one hash field with update(old value or None),
+        across processes, using WATCH/MULTI/EXEC: if another client modifies
+        the key in between, EXEC is rejected and update runs again on the new
+        value. Returns the new value.
+        """
+        with self._lock:
+            # The connection is shared, so the whole WATCH ... EXEC sequence holds the lock
+            while True:
+                watch, current = self.execute_many([('WATCH', key), ('HGET', key, field)])
+                for reply in (watch, current):
+                    if isinstance(reply, RespError):
+                        self.execute_many([('UNWATCH',)])
+                        raise reply
+                try:
+                    value = update(_decode_value(current))
+                except BaseException:
+                    self.execute_many([('UNWATCH',)])
+                    raise
+                replies = self.execute_many([
+                    ('MULTI',),
+                    ('HSET', key, field, json.dumps(value, ensure_ascii=False)),
+                    ('EXEC',),
+                ])
+                if replies[-1] is not None:
+                    for reply in replies[:-1] + replies[-1]:
+                        if isinstance(reply, RespError):
+                            raise reply
+                    return value
+                # Null EXEC reply: the watched key changed, retry
+
+
+async def _read_reply_async(reader):
+    line = (await reader.readline()).rstrip(b'\r\n')
+    if not line:
+        raise ConnectionError("Connection closed by server")
+    kind, rest = line[:1], line[1:]
+    if kind == b'+':
+        return rest.decode('utf-8')
+    if kind == b'-':
+        return RespError(rest.decode('utf-8'))
+    if kind == b':':
+        return int(rest)
+    if kind == b'$':
+        n = int(rest)
+        if n < 0:
+            return None
+        return (await reader.readexactly(n + 2))[:-2]
+    if kind == b'*':
+        n = int(rest)
+        if n < 0:
+            return None
+        return [await _read_reply_async(reader) for _ in range(n)]
+    raise RespError(f"Unexpected reply: {line!r}")
+
+
+class AsyncRespClient:
+    """
+    asyncio version of RespClient for raw commands, used where blocking the
+    event loop on a socket is not acceptable (e.g. api.py). Also provides
+    SUBSCRIBE on a dedicated connection.
+    """
+
+    def __init__(self, host='127.0.0.1', port=6390, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self._lock = None
+
+    @classmethod
+    def from_url(cls, url):
+        parts = urlsplit(url)
+        return cls(host=parts.hostname or '127.0.0.1', port=parts.port or 6379)
+
+    async def _connect(self):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def execute_many(self, commands):
+        """Send several commands in one write (pipelining) and return their replies."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await self._connect()
+            try:
+                self.writer.write(b''.join(encode_command(*each) for each in commands))
+                await self.writer.drain()
+                return [await asyncio.wait_for(_read_reply_async(self.reader), self.timeout) for _ in commands]
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                await self.close()
+                raise
+
+    async def execute(self, *args):
+        reply = (await self.execute_many([args]))[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    async def subscribe(self, *channels):
+        """
+        Async iterator over (channel, message bytes) published to channels.
+        Uses its own connection; raises ConnectionError when it is lost.
+        """
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        try:
+            writer.write(encode_command('SUBSCRIBE', *channels))
+            await writer.drain()
+            while True:
+                reply = await _read_reply_async(reader)
+                if isinstance(reply, RespError):
+                    raise reply
+                if isinstance(reply, list) and len(reply) == 3 and reply[0] == b'message':
+                    yield reply[1].decode('utf-8'), reply[2]
+        except asyncio.IncompleteReadError as e:
+            raise ConnectionError("Connection closed by server") from e
+        finally:
+            writer.close()
+
+
+def connect_store(url=None):
+    """
+    Return a RespClient for a redis:// URL (local server or real Redis),
+    or a file-backed LocalRedis when url is empty.
+    """
+    if url:
+        return RespClient.from_url(url)
+    from fakeredis.localredis import LocalRedis
+    return LocalRedis()
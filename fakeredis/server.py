@@ -0,0 +1,388 @@
+"""
+Local RESP server for the fake KV store.
+
+Speaks the subset of the Redis protocol used by this project
+(PING, GET, SET, DEL, EXISTS, TYPE, INCR, INCRBY, HSET, HGET, HGETALL,
+HDEL, EXPIRE, TTL, WATCH, UNWATCH, MULTI, EXEC, DISCARD, PUBLISH,
+SUBSCRIBE, UNSUBSCRIBE), including pipelined requests. Data is persisted
+with LocalRedis; expiry times, watches and subscriptions are kept in
+memory only.
+
+Commands run one at a time on the event loop, so each command and each
+MULTI/EXEC block is atomic. WATCH gives optimistic locking for
+read-modify-write from several processes: EXEC returns a null reply if
+a watched key was modified after WATCH.
+
+    python -m fakeredis.server --port 6390
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import logging
+import time
+
+from fakeredis.localredis import LocalRedis
+from fakeredis.resp import RespError, Status, encode_reply
+
+
+OK = Status('OK')
+QUEUED = Status('QUEUED')
+WRONGTYPE = "WRONGTYPE Operation against a key holding the wrong kind of value"
+NOT_INTEGER = "ERR value is not an integer or out of range"
+
+
+def _int(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise RespError(NOT_INTEGER) from None
+
+
+class Session:
+    """Per-connection transaction state."""
+
+    def __init__(self):
+        self.watched = set()
+        self.dirty = False   # a watched key was modified
+        self.queued = None   # commands queued after MULTI, None outside a transaction
+        self.failed = False  # a command was rejected while queuing
+
+
+class RespServer:
+    def __init__(self, store=None):
+        # Values are stored exactly as received (text), not JSON-decoded
+        self.store = store if store is not None else LocalRedis('local_redis_server.json')
+        self.expires = {}
+        self.channels = {}  # channel -> set of subscribed StreamWriter
+        self.watchers = {}  # key -> set of Session watching it
+
+    # ---- expiry --------------------------------------------------------
+
+    def _expired(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.time():
+            del self.expires[key]
+            self.store.delete(key)
+            self._touch(key)
+            return True
+        return False
+
+    def _touch(self, key):
+        """Mark transactions watching key as failed."""
+        for session in self.watchers.get(key, ()):
+            session.dirty = True
+
+    async def sweep_expired(self, interval=1.0):
+        while True:
+            await asyncio.sleep(interval)
+            for key in list(self.expires):
+                self._expired(key)
+
+    # ---- commands --------------------------------------------------------
+
+    def _resolve(self, args):
+        """Return the bound handler for a command, or a RespError for unknown commands and wrong arity."""
+        name = args[0].decode('utf-8').lower()
+        params = [each.decode('utf-8') for each in args[1:]]
+        handler = getattr(self, f"cmd_{name}", None)
+        if handler is None:
+            return RespError(f"ERR unknown command '{name.upper()}'")
+        try:
+            inspect.signature(handler).bind(*params)
+        except TypeError:
+            return RespError(f"ERR wrong number of arguments for '{name}' command")
+        return functools.partial(handler, *params)
+
+    def execute(self, args):
+        if not args:
+            return RespError("ERR empty command")
+        command = self._resolve(args)
+        if isinstance(command, RespError):
+            return command
+        try:
+            return command()
+        except RespError as e:
+            return e
+
+    def cmd_ping(self, message=None):
+        return Status('PONG') if message is None else message
+
+    def cmd_get(self, key):
+        if self._expired(key):
+            return None
+        value = self.store.get(key)
+        if isinstance(value, dict):
+            return RespError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def cmd_set(self, key, value, *options):
+        seconds = None
+        condition = None
+        i = 0
+        while i < len(options):
+            option = options[i].upper()
+            if option in ('EX', 'PX') and seconds is None and i + 1 < len(options):
+                amount = _int(options[i + 1])
+                if amount <= 0:
+                    return RespError("ERR invalid expire time in 'set' command")
+                seconds = amount / (1000 if option == 'PX' else 1)
+                i += 2
+            elif option in ('NX', 'XX') and condition is None:
+                condition = option
+                i += 1
+            else:
+                return RespError("ERR syntax error")
+        if condition is not None:
+            exists = not self._expired(key) and self.store.get(key) is not None
+            if exists != (condition == 'XX'):
+                return None
+        self.store.set(key, value)
+        self.expires.pop(key, None)
+        if seconds is not None:
+            self.expires[key] = time.time() + seconds
+        self._touch(key)
+        return OK
+
+    def cmd_del(self, *keys):
+        count = 0
+        for key in keys:
+            expired = self._expired(key)
+            self.expires.pop(key, None)
+            if not expired and self.store.delete(key):
+                self._touch(key)
+                count += 1
+        return count
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if not self._expired(key) and self.store.type(key) != 'none')
+
+    def cmd_type(self, key):
+        if self._expired(key):
+            return 'none'
+        return self.store.type(key)
+
+    def _check_hash(self, key):
+        if self.store.type(key) == 'string':
+            raise RespError(WRONGTYPE)
+
+    def cmd_incrby(self, key, amount):
+        self._expired(key)
+        with self.store.transaction():
+            if self.store.type(key) == 'hash':
+                return RespError(WRONGTYPE)
+            value = _int(self.store.get(key) or 0) + _int(amount)
+            self.store.set(key, str(value))
+            self._touch(key)
+            return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, 1)
+
+    def cmd_hset(self, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            return RespError("ERR wrong number of arguments for 'hset' command")
+        self._expired(key)
+        with self.store.transaction():
+            self._check_hash(key)
+            count = sum(self.store.hset(key, pairs[i], pairs[i + 1]) for i in range(0, len(pairs), 2))
+        self._touch(key)
+        return count
+
+    def cmd_hget(self, key, field):
+        if self._expired(key):
+            return None
+        self._check_hash(key)
+        return self.store.hget(key, field)
+
+    def cmd_hgetall(self, key):
+        if self._expired(key):
+            return []
+        self._check_hash(key)
+        reply = []
+        for field, value in self.store.hgetall(key).items():
+            reply += [field, value]
+        return reply
+
+    def cmd_hdel(self, key, *fields):
+        if self._expired(key):
+            return 0
+        with self.store.transaction():
+            self._check_hash(key)
+            count = sum(self.store.hdel(key, field) for field in fields)
+        if count:
+            self._touch(key)
+        return count
+
+    def cmd_expire(self, key, seconds):
+        seconds = _int(seconds)
+        if self._expired(key) or self.store.type(key) == 'none':
+            return 0
+        self.expires[key] = time.time() + seconds
+        self._touch(key)
+        return 1
+
+    def cmd_ttl(self, key):
+        if self._expired(key) or self.store.type(key) == 'none':
+            return -2
+        if key not in self.expires:
+            return -1
+        return int(round(self.expires[key] - time.time()))
+
+    # ---- transactions ----------------------------------------------------
+
+    def transact(self, session, args):
+        """
+        Run a command for one connection: handles WATCH/UNWATCH/MULTI/EXEC/DISCARD
+        and queues other commands while inside MULTI.
+        """
+        name = args[0].upper() if args else b''
+        if name == b'MULTI':
+            if session.queued is not None:
+                return RespError("ERR MULTI calls can not be nested")
+            session.queued = []
+            return OK
+        if name in (b'EXEC', b'DISCARD'):
+            if session.queued is None:
+                return RespError(f"ERR {name.decode('utf-8')} without MULTI")
+            queued, failed, dirty = session.queued, session.failed, session.dirty
+            session.queued = None
+            session.failed = False
+            self.unwatch(session)
+            if name == b'DISCARD':
+                return OK
+            if failed:
+                return RespError("EXECABORT Transaction discarded because of previous errors.")
+            if dirty:
+                return None
+            return [self.execute(each) for each in queued]
+        if session.queued is not None:
+            if name == b'WATCH':
+                return RespError("ERR WATCH inside MULTI is not allowed")
+            command = self._resolve(args) if args else RespError("ERR empty command")
+            if isinstance(command, RespError):
+                session.failed = True
+                return command
+            session.queued.append(args)
+            return QUEUED
+        if name == b'WATCH':
+            if len(args) < 2:
+                return RespError("ERR wrong number of arguments for 'watch' command")
+            for key in args[1:]:
+                key = key.decode('utf-8')
+                session.watched.add(key)
+                self.watchers.setdefault(key, set()).add(session)
+            return OK
+        if name == b'UNWATCH':
+            self.unwatch(session)
+            return OK
+        return self.execute(args)
+
+    def unwatch(self, session):
+        for key in session.watched:
+            sessions = self.watchers.get(key)
+            if sessions is not None:
+                sessions.discard(session)
+                if not sessions:
+                    del self.watchers[key]
+        session.watched.clear()
+        session.dirty = False
+
+    # ---- pub/sub ---------------------------------------------------------
+
+    def cmd_publish(self, channel, message):
+        subscribers = self.channels.get(channel, ())
+        data = encode_reply(['message', channel, message])
+        for writer in subscribers:
+            # Buffered without waiting; each subscriber's handler drains its own writer
+            writer.write(data)
+        return len(subscribers)
+
+    def subscribe(self, writer, args):
+        """Handle SUBSCRIBE / UNSUBSCRIBE, which need the connection's writer."""
+        name = args[0].decode('utf-8').lower()
+        channels = [each.decode('utf-8') for each in args[1:]]
+        subscribed = {channel for channel, writers in self.channels.items() if writer in writers}
+        if name == 'subscribe':
+            if not channels:
+                return encode_reply(RespError("ERR wrong number of arguments for 'subscribe' command"))
+            replies = []
+            for channel in channels:
+                self.channels.setdefault(channel, set()).add(writer)
+                subscribed.add(channel)
+                replies.append(encode_reply(['subscribe', channel, len(subscribed)]))
+            return b''.join(replies)
+        replies = []
+        for channel in channels or sorted(subscribed):
+            self._unsubscribe(writer, channel)
+            subscribed.discard(channel)
+            replies.append(encode_reply(['unsubscribe', channel, len(subscribed)]))
+        return b''.join(replies) or encode_reply(['unsubscribe', None, 0])
+
+    def _unsubscribe(self, writer, channel):
+        writers = self.channels.get(channel)
+        if writers is not None:
+            writers.discard(writer)
+            if not writers:
+                del self.channels[channel]
+
+    # ---- protocol --------------------------------------------------------
+
+    async def read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        line = line.rstrip(b'\r\n')
+        if not line.startswith(b'*'):
+            # Inline command (redis-cli / telnet)
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            header = await reader.readline()
+            if not header.startswith(b'$'):
+                raise ValueError(f"Expected bulk string, got {header!r}")
+            data = await reader.readexactly(int(header[1:]) + 2)
+            args.append(data[:-2])
+        return args
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        session = Session()
+        try:
+            while True:
+                args = await self.read_command(reader)
+                if args is None:
+                    break
+                if args and args[0].upper() in (b'SUBSCRIBE', b'UNSUBSCRIBE'):
+                    writer.write(self.subscribe(writer, args))
+                else:
+                    writer.write(encode_reply(self.transact(session, args)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError as e:
+            logging.error(f"Protocol error from {peer}: {e}")
+        finally:
+            self.unwatch(session)
+            for channel in list(self.channels):
+                self._unsubscribe(writer, channel)
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=6390):
+        server = await asyncio.start_server(self.handle, host, port)
+        logging.info(f"RESP server listening on {host}:{port}")
+        sweeper = asyncio.create_task(self.sweep_expired())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local RESP server for the fake KV store")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(RespServer().serve(args.host, args.port))
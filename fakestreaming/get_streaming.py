@@ -1,36 +1,140 @@
-
 from .streaming import LocalStreamClientSimulator, PutMessagesDetails, PutMessagesDetailsEntry
+from config import StreamConfig
+import asyncio
 import json
 import base64
+import threading
 import time
 
 
 print("\n--- Getting Messages ---")
 
 
-def get_messages(cursor, limit=2, **kwargs):
-    simulator = LocalStreamClientSimulator(base_storage_path="my_local_streams")
-    my_stream_id = "ocid1.stream.oc1..exampleuniqueID"
-    data = True
-    while data:
-        time.sleep(1)
-        get_response = simulator.get_messages(stream_id=my_stream_id, cursor=cursor, limit=limit)
-        data = get_response.data
-        #print(f"\nGet 1 Status: {get_response.status}")
-        #print(f"Get 1 Next Cursor: {get_response.headers.get('opc-next-cursor')}")
-        cursor = get_response.headers.get('opc-next-cursor')
-    
-        for msg in get_response.data:
-            # Decode key/value for display if needed (remember they are base64)
-            key_decoded = base64.b64decode(msg.key).decode('utf-8') if msg.key else None
+def _decode_value(msg):
+    # Decode key/value for display if needed (remember they are base64)
+    try:
+        return base64.b64decode(msg.value).decode('utf-8')
+    except UnicodeDecodeError:
+        return base64.b64decode(msg.value) # Keep as bytes if not utf-8
+
+
+class StreamMessage:
+    """读取到的一条消息。处理完（包括处理失败）后调用 ack，其位置才会提交。"""
+
+    def __init__(self, consumer, partition, offset, value):
+        self.consumer = consumer
+        self.partition = partition
+        self.offset = offset
+        self.value = value
+
+    def ack(self):
+        self.consumer.ack(self.partition, self.offset)
+
+
+class StreamConsumer:
+    """
+    消费组成员。同一组的多个进程分摊各分区，进程重启后从提交位置继续。
+    poll 在没有消息时阻塞等待，新消息写入后立即返回。
+    每个分区只提交到最早一条未 ack 的消息之前，处理中的消息在进程崩溃后会被重新读取（至少一次）。
+    后台线程每 HEARTBEAT_INTERVAL 秒发送心跳并提交已处理的位置，
+    因此背压暂停读取时实例不会被移出消费组，分区不会被其它进程接手。
+    """
+
+    def __init__(self, group_name=StreamConfig.GROUP_NAME, instance_name=StreamConfig.INSTANCE_NAME,
+                 limit=StreamConfig.POLL_LIMIT, timeout=StreamConfig.POLL_TIMEOUT,
+                 heartbeat_interval=StreamConfig.HEARTBEAT_INTERVAL):
+        self.simulator = LocalStreamClientSimulator(base_storage_path=StreamConfig.STORAGE_PATH,
+                                                    partitions=StreamConfig.PARTITIONS,
+                                                    session_timeout=StreamConfig.SESSION_TIMEOUT)
+        self.stream_id = StreamConfig.STREAM_ID
+        self.limit = limit
+        self.timeout = timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.cursor = self.simulator.create_group_cursor(stream_id=self.stream_id, group_name=group_name,
+                                                         instance_name=instance_name,
+                                                         commit_on_get=False).data.value
+        self.lock = threading.Lock()
+        self.in_flight = {}  # partition -> 已读取未 ack 的 offset
+        self.next_offsets = {}  # partition -> 下一条要读取的 offset
+        self.committed = {}
+        self.closed = threading.Event()
+        self.heartbeat_thread = threading.Thread(target=self._heartbeat, name="stream-heartbeat", daemon=True)
+        self.heartbeat_thread.start()
+
+    def poll(self):
+        """读取一批消息（StreamMessage），最多等待 timeout 秒，超时返回空列表。"""
+        get_response = self.simulator.get_messages(stream_id=self.stream_id, cursor=self.cursor,
+                                                   limit=self.limit, timeout=self.timeout)
+        self.cursor = get_response.headers.get('opc-next-cursor')
+        messages = []
+        with self.lock:
+            for msg in get_response.data:
+                self.in_flight.setdefault(msg.partition, set()).add(msg.offset)
+                self.next_offsets[msg.partition] = msg.offset + 1
+                messages.append(StreamMessage(self, msg.partition, msg.offset, _decode_value(msg)))
+        return messages
+
+    def ack(self, partition, offset):
+        """标记一条消息已处理完，由后台线程提交。"""
+        with self.lock:
+            self.in_flight[partition].discard(offset)
+
+    def _commit(self):
+        with self.lock:
+            offsets = {p: min(self.in_flight[p]) if self.in_flight.get(p) else offset
+                       for p, offset in self.next_offsets.items()}
+        offsets = {p: offset for p, offset in offsets.items() if self.committed.get(p) != offset}
+        if offsets:
+            self.simulator.consumer_commit(stream_id=self.stream_id, cursor=self.cursor, offsets=offsets)
+            self.committed.update(offsets)
+
+    def _heartbeat(self):
+        while not self.closed.wait(self.heartbeat_interval):
             try:
-                value_decoded = base64.b64decode(msg.value).decode('utf-8')
-            except UnicodeDecodeError:
-                value_decoded = base64.b64decode(msg.value) # Keep as bytes if not utf-8
-            # print(f"  Offset: {msg.offset}, Key: {key_decoded}, Value: {value_decoded}, Timestamp: {msg.timestamp}")
+                self.simulator.consumer_heartbeat(stream_id=self.stream_id, cursor=self.cursor)
+                self._commit()
+            except Exception as e:
+                print(f"Stream heartbeat failed: {e}")
+
+    def close(self):
+        # 提交已处理的位置并退出消费组，分区立即分配给其它实例
+        self.closed.set()
+        self.heartbeat_thread.join()
+        self._commit()
+        self.simulator.leave_group(stream_id=self.stream_id, cursor=self.cursor)
+
+
+def get_messages(group_name=StreamConfig.GROUP_NAME, instance_name=StreamConfig.INSTANCE_NAME,
+                 limit=StreamConfig.POLL_LIMIT, **kwargs):
+    """
+    持续读取消息，没有消息时阻塞等待，不会因为一段时间没有消息而结束。
+    调用方取下一条消息时，上一条视为已处理。
+    """
+    consumer = StreamConsumer(group_name, instance_name, limit)
+    try:
+        while True:
+            for msg in consumer.poll():
+                yield msg.value
+                msg.ack()
+    finally:
+        consumer.close()
+
 
-            yield value_decoded
+async def aget_messages(group_name=StreamConfig.GROUP_NAME, instance_name=StreamConfig.INSTANCE_NAME,
+                        limit=StreamConfig.POLL_LIMIT, **kwargs):
+    """
+    get_messages 的异步版本，返回 StreamMessage，阻塞读取在线程中执行，不占用事件循环。
+    消息可能被并发处理，调用方在处理完后调用 msg.ack()。
+    """
+    loop = asyncio.get_running_loop()
+    consumer = await loop.run_in_executor(None, StreamConsumer, group_name, instance_name, limit)
+    try:
+        while True:
+            for msg in await loop.run_in_executor(None, consumer.poll):
+                yield msg
+    finally:
+        await loop.run_in_executor(None, consumer.close)
 
 if __name__ == "__main__":
-    for msg in get_messages(cursor="100", limit=2):
-        print(msg)
\ No newline at end of file
+    for msg in get_messages(group_name="console"):
+        print(msg)
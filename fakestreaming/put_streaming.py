@@ -7,20 +7,20 @@ sys.path.insert(0, parent_dir)
 from streaming import LocalStreamClientSimulator, PutMessagesDetails, PutMessagesDetailsEntry
 import json
 from utils.models import VideoInfo
+from config import StreamConfig
 import time
 
 # --- Example Usage ---
 
 # 1. Initialize the Simulator
-simulator = LocalStreamClientSimulator(base_storage_path="my_local_streams")
+simulator = LocalStreamClientSimulator(base_storage_path=StreamConfig.STORAGE_PATH,
+                                       partitions=StreamConfig.PARTITIONS)
 
 # 2. Define a Stream ID
-my_stream_id = "ocid1.stream.oc1..exampleuniqueID"
+my_stream_id = StreamConfig.STREAM_ID
 
-# 清空文件
-file = simulator._get_stream_file_path(my_stream_id)
-with open(file, 'w', encoding='utf-8') as f:
-    f.write("")
+# 清空 stream
+simulator.reset_stream(my_stream_id)
 
 allcount = 80
 for i in range(allcount):
@@ -43,7 +43,7 @@ for i in range(allcount):
 
     put_details = PutMessagesDetails(
         messages=[ 
-            PutMessagesDetailsEntry(key="message-key-1", value=json_data) 
+            PutMessagesDetailsEntry(key=videoinfo.device_id, value=json_data) # 按设备分区，同一设备的片段保持顺序
             ])
 
     put_response = simulator.put_messages(stream_id=my_stream_id, put_messages_details=put_details)
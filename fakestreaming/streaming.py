@@ -1,10 +1,26 @@
 import os
 import json
 import base64
+import bisect
+import hashlib
+import mmap
+import select
+import shutil
+import socket
+import struct
+import tempfile
+import threading
 import time
 import uuid
+from contextlib import contextmanager
 from types import SimpleNamespace # Useful for creating simple objects that mimic SDK responses
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 # Define placeholder classes to mimic OCI models for clarity
 # In a real scenario, you might not need these if you only access .key and .value
 class PutMessagesDetailsEntry:
@@ -30,74 +46,636 @@ class SimulatedMessage:
         self.value = value         # Store as base64 string (as received from Put)
         self.timestamp = timestamp # Store Unix timestamp
 
+# Record layout in a segment log: header (body length, timestamp, key length), key, value.
+# key and value are the base64 strings received from put_messages, stored as ASCII bytes.
+RECORD_HEADER = struct.Struct('<IdH')
+# Sparse index entry: (offset relative to the segment base offset, byte position in the log)
+INDEX_ENTRY = struct.Struct('<II')
+
+
+class _Segment:
+    """
+    One segment of a stream: `<base_offset>.log` holds the records and
+    `<base_offset>.index` holds a sparse offset -> position index
+    (one entry every `index_interval` records). Reads go through mmap and
+    only parse the fixed-size record headers while seeking.
+    """
+    def __init__(self, directory, base_offset, index_interval, partition="0"):
+        self.base_offset = base_offset
+        self.partition = partition
+        self.index_interval = index_interval
+        name = str(base_offset).zfill(20)
+        self.log_path = os.path.join(directory, name + '.log')
+        self.index_path = os.path.join(directory, name + '.index')
+        self.index = []       # [(relative offset, position)]
+        self.count = 0        # number of complete records known
+        self.end = 0          # position right after the last known record
+        self._mmap = None
+        self._mapped = 0
+        self._log_file = None
+        self._index_file = None
+        if not os.path.exists(self.log_path):
+            open(self.log_path, 'ab').close()
+        self._load_index()
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            self.index = [INDEX_ENTRY.unpack_from(data, i) for i in range(0, usable, INDEX_ENTRY.size)]
+        if self.index:
+            self.count, self.end = self.index[-1]
+        self.refresh()
+
+    def refresh(self):
+        """Map newly appended bytes and advance count/end past complete records."""
+        size = os.path.getsize(self.log_path)
+        if size > self._mapped:
+            if self._mmap is not None:
+                self._mmap.close()
+            with open(self.log_path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            self._mapped = size
+        while self.end + RECORD_HEADER.size <= self._mapped:
+            body_len, _, _ = RECORD_HEADER.unpack_from(self._mmap, self.end)
+            next_pos = self.end + RECORD_HEADER.size + body_len
+            if next_pos > self._mapped:
+                break  # record still being written
+            if self.count % self.index_interval == 0 and (not self.index or self.index[-1][0] < self.count):
+                self.index.append((self.count, self.end))
+            self.count += 1
+            self.end = next_pos
+
+    @property
+    def next_offset(self):
+        return self.base_offset + self.count
+
+    def read(self, stream_id, offset, limit):
+        """Return up to `limit` SimulatedMessage starting at absolute `offset`."""
+        rel = offset - self.base_offset
+        if rel >= self.count or limit <= 0:
+            return []
+        i = bisect.bisect_right(self.index, (rel, float('inf'))) - 1
+        current, pos = self.index[i] if i >= 0 else (0, 0)
+        buf = self._mmap
+        # Skip to the requested record using headers only
+        while current < rel:
+            body_len, _, _ = RECORD_HEADER.unpack_from(buf, pos)
+            pos += RECORD_HEADER.size + body_len
+            current += 1
+        messages = []
+        while current < self.count and len(messages) < limit:
+            body_len, timestamp, key_len = RECORD_HEADER.unpack_from(buf, pos)
+            body_start = pos + RECORD_HEADER.size
+            key = buf[body_start:body_start + key_len].decode('ascii') if key_len else None
+            value = buf[body_start + key_len:body_start + body_len].decode('ascii')
+            messages.append(SimulatedMessage(
+                stream=stream_id,
+                partition=self.partition,
+                offset=self.base_offset + current,
+                key=key,
+                value=value,
+                timestamp=timestamp
+            ))
+            pos = body_start + body_len
+            current += 1
+        return messages
+
+    def append(self, entries, timestamp):
+        """Append (key, value) pairs. Only the stream's single writer calls this."""
+        if self._log_file is None:
+            self._log_file = open(self.log_path, 'ab')
+            self._index_file = open(self.index_path, 'ab')
+        self.refresh()
+        chunks = []
+        index_chunks = []
+        pos = self.end
+        count = self.count
+        for key, value in entries:
+            key_bytes = key.encode('ascii') if key else b''
+            value_bytes = value.encode('ascii')
+            body_len = len(key_bytes) + len(value_bytes)
+            if count % self.index_interval == 0:
+                index_chunks.append(INDEX_ENTRY.pack(count, pos))
+            chunks.append(RECORD_HEADER.pack(body_len, timestamp, len(key_bytes)))
+            chunks.append(key_bytes)
+            chunks.append(value_bytes)
+            pos += RECORD_HEADER.size + body_len
+            count += 1
+        self._log_file.write(b''.join(chunks))
+        self._log_file.flush()
+        if index_chunks:
+            self._index_file.write(b''.join(index_chunks))
+            self._index_file.flush()
+        self.refresh()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+            self._mapped = 0
+        for f in (self._log_file, self._index_file):
+            if f is not None:
+                f.close()
+        self._log_file = self._index_file = None
+
+    def delete(self):
+        self.close()
+        for path in (self.log_path, self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class _StreamLog:
+    """
+    All segments of one stream. Offsets are message offsets that keep
+    increasing across segments. The active (last) segment rolls over once
+    it reaches `segment_bytes`; closed segments older than
+    `retention_seconds` are deleted.
+    """
+    def __init__(self, directory, segment_bytes, index_interval, retention_seconds, partition="0"):
+        self.directory = directory
+        self.partition = partition
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        self.retention_seconds = retention_seconds
+        os.makedirs(self.directory, exist_ok=True)
+        self.segments = []
+        self._scan()
+
+    def _scan(self):
+        """Pick up segments created or deleted by another process."""
+        known = {seg.base_offset: seg for seg in self.segments}
+        bases = sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith('.log'))
+        if not bases:
+            bases = [0]
+        for base, seg in known.items():
+            if base not in bases:
+                seg.close()
+        self.segments = [known.get(base) or _Segment(self.directory, base, self.index_interval, self.partition) for base in bases]
+
+    def append(self, entries, timestamp):
+        active = self.segments[-1]
+        active.refresh()
+        if active.end >= self.segment_bytes:
+            active.close()
+            active = _Segment(self.directory, active.next_offset, self.index_interval, self.partition)
+            self.segments.append(active)
+            self._apply_retention()
+        first_offset = active.next_offset
+        active.append(entries, timestamp)
+        return first_offset
+
+    def _apply_retention(self):
+        if self.retention_seconds is None:
+            return
+        deadline = time.time() - self.retention_seconds
+        while len(self.segments) > 1 and os.path.getmtime(self.segments[0].log_path) < deadline:
+            self.segments.pop(0).delete()
+
+    @property
+    def start_offset(self):
+        return self.segments[0].base_offset
+
+    @property
+    def end_offset(self):
+        active = self.segments[-1]
+        active.refresh()
+        if active.end >= self.segment_bytes:
+            # The writer may have rolled over to a new segment
+            self._scan()
+            self.segments[-1].refresh()
+        return self.segments[-1].next_offset
+
+    def read(self, stream_id, offset, limit):
+        self.segments[-1].refresh()
+        if offset >= self.segments[-1].next_offset:
+            # Caught up: check whether the writer rolled over to a new segment
+            self._scan()
+            self.segments[-1].refresh()
+        if offset < self.segments[0].base_offset:
+            # Older messages were removed by retention, start at the oldest one
+            offset = self.segments[0].base_offset
+        bases = [seg.base_offset for seg in self.segments]
+        i = max(bisect.bisect_right(bases, offset) - 1, 0)
+        messages = []
+        while i < len(self.segments) and len(messages) < limit:
+            seg = self.segments[i]
+            seg.refresh()
+            batch = seg.read(stream_id, offset, limit - len(messages))
+            messages.extend(batch)
+            offset = messages[-1].offset + 1 if messages else offset
+            if offset < seg.next_offset:
+                break
+            i += 1
+        return messages
+
+    def close(self):
+        for seg in self.segments:
+            seg.close()
+
+
+class _Watcher:
+    """
+    Cross-process wakeup for readers blocked on one stream.
+    Each waiting reader binds a Unix datagram socket in a directory derived
+    from the stream directory (kept under the temp dir, since socket paths
+    are limited to ~100 bytes); the writer sends one byte to every socket
+    there after appending. Sockets left behind by dead readers are removed
+    when a send to them is refused. Unavailable where the platform has no
+    AF_UNIX datagram sockets (Windows): listen() then yields None.
+    """
+    available = hasattr(socket, 'AF_UNIX')
+
+    def __init__(self, stream_dir):
+        digest = hashlib.sha1(os.path.abspath(stream_dir).encode('utf-8')).hexdigest()[:16]
+        self.directory = os.path.join(tempfile.gettempdir(), f"fakestreaming-{digest}")
+
+    @contextmanager
+    def listen(self):
+        if not self.available:
+            yield None
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.bind(path)
+            sock.setblocking(False)
+            yield sock
+        finally:
+            sock.close()
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def drain(sock):
+        try:
+            while sock.recv(64):
+                pass
+        except BlockingIOError:
+            pass
+
+    def notify(self):
+        if not self.available:
+            return
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        if not names:
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            for name in names:
+                path = os.path.join(self.directory, name)
+                try:
+                    sock.sendto(b'\0', path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # The reader exited without removing its socket
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                except OSError:
+                    # Receive buffer full: the reader already has a wakeup pending
+                    pass
+
+
+class _Stream:
+    """
+    A stream with a fixed number of partitions, each one a _StreamLog in
+    its own sub-directory. The partition count is stored in `meta.json`
+    when the stream is created.
+    """
+    def __init__(self, directory, partitions, segment_bytes, index_interval, retention_seconds):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path = os.path.join(self.directory, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                partitions = json.load(f)["partitions"]
+        else:
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({"partitions": partitions}, f)
+        self.partitions = [
+            _StreamLog(os.path.join(self.directory, str(p)), segment_bytes, index_interval, retention_seconds, str(p))
+            for p in range(partitions)
+        ]
+        self._next_partition = 0
+        self.watcher = _Watcher(self.directory)
+
+    def partition_for(self, key):
+        """Messages with the same key always go to the same partition."""
+        if key is None:
+            p = self._next_partition
+            self._next_partition = (p + 1) % len(self.partitions)
+            return p
+        digest = hashlib.md5(base64.b64decode(key)).digest()
+        return int.from_bytes(digest[:4], 'big') % len(self.partitions)
+
+    def append(self, entries, timestamp):
+        """Append (key, value) pairs. Returns [(partition, offset)] in input order."""
+        by_partition = {}
+        for i, (key, value) in enumerate(entries):
+            by_partition.setdefault(self.partition_for(key), []).append((i, key, value))
+        result = [None] * len(entries)
+        for p, items in by_partition.items():
+            first_offset = self.partitions[p].append([(key, value) for _, key, value in items], timestamp)
+            for n, (i, _, _) in enumerate(items):
+                result[i] = (str(p), first_offset + n)
+        return result
+
+    def end_offsets(self):
+        """Next offset of every partition; changes whenever a message is appended."""
+        return [log.end_offset for log in self.partitions]
+
+    def close(self):
+        for log in self.partitions:
+            log.close()
+
+
+class _FileLock:
+    """Exclusive lock on a file, shared between processes."""
+    def __init__(self, path):
+        self._file = open(path, 'a+b')
+        # flock does not exclude threads sharing one file object
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def locked(self):
+        with self._thread_lock:
+            with self._file_locked():
+                yield
+
+    @contextmanager
+    def _file_locked(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def close(self):
+        self._file.close()
+
+
+class _ConsumerGroup:
+    """
+    Shared state of one consumer group, kept in `<group>.json` next to a
+    lock file: the committed offset of every partition and the heartbeat
+    time of every live instance. Partitions are assigned to the live
+    instances (sorted by name) round robin, so each partition - and every
+    device whose key maps to it - is read by one instance at a time.
+    After a rebalance the new owner resumes from the last committed offset,
+    so delivery is at-least-once as long as offsets are committed only after
+    the messages are processed (commit_on_get=False plus consumer_commit).
+    An instance that neither reads nor sends heartbeats for session_timeout
+    seconds is removed from the group.
+    """
+    def __init__(self, path, session_timeout):
+        self.path = path
+        self.session_timeout = session_timeout
+        self.lock = _FileLock(path + '.lock')
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"members": {}, "committed": {}}
+
+    def _save(self, state):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def join(self, instance, partitions, commits=None):
+        """
+        Heartbeat `instance`, commit `commits` ({partition: next offset})
+        and return (assigned partitions, committed offsets).
+        """
+        with self.lock.locked():
+            state = self._load()
+            now = time.time()
+            state["members"] = {name: beat for name, beat in state["members"].items()
+                                if beat >= now - self.session_timeout}
+            state["members"][instance] = now
+            for p, offset in (commits or {}).items():
+                state["committed"][p] = max(offset, state["committed"].get(p, 0))
+            self._save(state)
+        members = sorted(state["members"])
+        index = members.index(instance)
+        assigned = [str(p) for p in range(partitions) if p % len(members) == index]
+        return assigned, state["committed"]
+
+    def commit(self, commits):
+        with self.lock.locked():
+            state = self._load()
+            for p, offset in commits.items():
+                state["committed"][p] = max(offset, state["committed"].get(p, 0))
+            self._save(state)
+
+    def leave(self, instance):
+        with self.lock.locked():
+            state = self._load()
+            state["members"].pop(instance, None)
+            self._save(state)
+
+    def close(self):
+        self.lock.close()
+
+
+def _encode_cursor(cursor):
+    return base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    """
+    Decode an opaque cursor. A plain number is accepted as an offset in
+    partition "0", which is what the single-partition simulator used.
+    """
+    if isinstance(cursor, int) or (isinstance(cursor, str) and cursor.isdigit()):
+        return {"p": "0", "o": int(cursor)}
+    return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+
+
 class LocalStreamClientSimulator:
     """
     Simulates oci.streaming.StreamClient using local files.
-    Stores each stream_id as a '.stream' file in the base_storage_path.
-    Messages are stored as JSON lines.
+    Each stream_id is a directory in the base_storage_path with one
+    sub-directory of segment files per partition (see _Segment). Messages
+    are assigned to partitions by key, so messages with the same key keep
+    their order.
+
+    Cursors are opaque strings, as in OCI:
+      - create_cursor() reads one partition from an offset.
+      - create_group_cursor() joins a consumer group; get_messages() then
+        reads the partitions assigned to this instance, starting from the
+        group's committed offsets (see _ConsumerGroup).
+    A plain number is still accepted as an offset in partition "0".
+
+    A legacy '<stream_id>.stream' JSON-lines file is imported once when the
+    stream directory does not exist yet.
+
+    One process writes a stream (put_messages); any number of processes may read it.
     """
-    def __init__(self, base_storage_path="local_oci_streams"):
+    def __init__(self, base_storage_path="local_oci_streams", partitions=1,
+                 segment_bytes=16 * 1024 * 1024, index_interval=64,
+                 retention_seconds=24 * 3600, session_timeout=30, watch_interval=0.01,
+                 max_watch_interval=1.0):
         """
         Initializes the simulator.
 
         Args:
             base_storage_path (str): Directory to store stream files.
                                      Defaults to 'local_oci_streams'.
+            partitions (int): Number of partitions of streams created by this
+                              simulator. Existing streams keep their own count.
+            segment_bytes (int): Roll over to a new segment file at this size.
+            index_interval (int): Write one sparse index entry every N messages.
+            retention_seconds (float): Delete closed segments older than this.
+                                       None keeps everything.
+            session_timeout (float): A group instance that has not called
+                                     get_messages or consumer_heartbeat for this
+                                     long loses its partitions.
+            watch_interval (float): First interval at which a blocking get_messages
+                                    re-checks the segment files. Writers wake blocked
+                                    readers in any process (see _Watcher), so the check
+                                    only covers lost wakeups and platforms without
+                                    Unix sockets.
+            max_watch_interval (float): The check interval doubles up to this value
+                                        while nothing arrives.
         """
         current_path = os.path.dirname(os.path.abspath(__file__))
         self.base_storage_path = os.path.join(current_path, base_storage_path)
+        self.partitions = partitions
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        self.retention_seconds = retention_seconds
+        self.session_timeout = session_timeout
+        self.watch_interval = watch_interval
+        self.max_watch_interval = max(max_watch_interval, watch_interval)
+        # Wakes blocking get_messages calls in this process when _Watcher is unavailable
+        self._appended = threading.Condition()
+        self.streams = {}
+        self.groups = {}
         os.makedirs(self.base_storage_path, exist_ok=True)
         print(f"LocalStreamClientSimulator initialized. Storage path: {self.base_storage_path}")
 
-    def _get_stream_file_path(self, stream_id):
-        """Gets the file path for a given stream_id."""
+    def _safe_name(self, name):
         # Basic sanitization to prevent directory traversal, replace invalid chars
-        safe_filename = "".join(c if c.isalnum() or c in ('-', '_', '.') else '_' for c in stream_id)
+        safe_filename = "".join(c if c.isalnum() or c in ('-', '_', '.') else '_' for c in name)
         if not safe_filename:
             raise ValueError("Invalid stream_id resulting in empty filename")
-        return os.path.join(self.base_storage_path, f"{safe_filename}.stream")
+        return safe_filename
+
+    def _get_stream_file_path(self, stream_id):
+        """Gets the legacy JSON-lines file path for a given stream_id."""
+        return os.path.join(self.base_storage_path, f"{self._safe_name(stream_id)}.stream")
+
+    def _get_stream_dir(self, stream_id):
+        """Gets the segment directory for a given stream_id."""
+        return os.path.join(self.base_storage_path, f"{self._safe_name(stream_id)}.segments")
+
+    def _get_groups_dir(self, stream_id):
+        """Gets the consumer group directory for a given stream_id."""
+        return os.path.join(self.base_storage_path, f"{self._safe_name(stream_id)}.groups")
+
+    def _get_stream(self, stream_id):
+        if stream_id not in self.streams:
+            directory = self._get_stream_dir(stream_id)
+            is_new = not os.path.exists(os.path.join(directory, 'meta.json'))
+            stream = _Stream(directory, self.partitions, self.segment_bytes,
+                             self.index_interval, self.retention_seconds)
+            if is_new:
+                self._import_legacy(stream_id, stream)
+            self.streams[stream_id] = stream
+        return self.streams[stream_id]
+
+    def _get_group(self, stream_id, group_name):
+        if (stream_id, group_name) not in self.groups:
+            directory = self._get_groups_dir(stream_id)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{self._safe_name(group_name)}.json")
+            self.groups[(stream_id, group_name)] = _ConsumerGroup(path, self.session_timeout)
+        return self.groups[(stream_id, group_name)]
+
+    def _import_legacy(self, stream_id, stream):
+        legacy_path = self._get_stream_file_path(stream_id)
+        if not os.path.exists(legacy_path):
+            return
+        count = 0
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    message_data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                stream.append([(message_data.get("key"), message_data.get("value"))],
+                              message_data.get("timestamp", time.time()))
+                count += 1
+        print(f"Imported {count} messages from legacy stream file '{legacy_path}'.")
+
+    def reset_stream(self, stream_id):
+        """Deletes all messages and consumer group offsets of a stream."""
+        stream = self.streams.pop(stream_id, None)
+        if stream is not None:
+            stream.close()
+        for key in [key for key in self.groups if key[0] == stream_id]:
+            self.groups.pop(key).close()
+        shutil.rmtree(self._get_stream_dir(stream_id), ignore_errors=True)
+        shutil.rmtree(self._get_groups_dir(stream_id), ignore_errors=True)
+        self._get_stream(stream_id)
 
     def put_messages(self, stream_id, put_messages_details, **kwargs):
         """
-        Simulates putting messages to a stream (appends to a file).
+        Simulates putting messages to a stream (appends to the active segment
+        of each message's partition).
 
         Args:
             stream_id (str): The identifier of the stream.
             put_messages_details (PutMessagesDetails): Object containing messages to put.
                                                       Expects messages with base64 encoded values.
+                                                      Messages with the same key go to the same partition.
             **kwargs: Accepts other arguments like opc_request_id for compatibility, but ignores them.
 
         Returns:
             SimpleNamespace: Mimics the OCI SDK response structure with a 'data' attribute.
                              'data' indicates the number of successful puts (no failure simulation yet).
         """
-        file_path = self._get_stream_file_path(stream_id)
-        count = 0
-        entries_info = [] # To mimic the structure if needed later
-
         try:
-            with open(file_path, 'a', encoding='utf-8') as f:
-                current_timestamp = time.time() # Use current time for timestamp
-                for msg_entry in put_messages_details.messages:
-                    # OCI SDK expects value to be base64 encoded string already
-                    # OCI SDK expects key to be base64 encoded string already
-                    message_data = {
-                        "key": msg_entry.key, # Assumed already base64 encoded string or None
-                        "value": msg_entry.value, # Assumed already base64 encoded string
-                        "timestamp": current_timestamp,
-                        # Add other metadata if needed for simulation
-                    }
-                    # Append as a JSON line
-                    f.write(json.dumps(message_data) + '\n')
-                    count += 1
-                    # Mimic entry result structure (simplified)
-                    entries_info.append(SimpleNamespace(error=None, error_message=None, offset=None, partition=None)) # Offset/Partition not known until read in real OCI
+            stream = self._get_stream(stream_id)
+            current_timestamp = time.time() # Use current time for timestamp
+            # OCI SDK expects key/value to be base64 encoded strings already
+            entries = [(msg_entry.key, msg_entry.value) for msg_entry in put_messages_details.messages]
+            positions = stream.append(entries, current_timestamp)
+            with self._appended:
+                self._appended.notify_all()
+            stream.watcher.notify()
+            entries_info = [SimpleNamespace(error=None, error_message=None, offset=offset, partition=partition)
+                            for partition, offset in positions]
 
             # Simulate the response structure
             # Real response has 'failures' (int) and 'entries' (list) in data
             response_data = SimpleNamespace(failures=0, entries=entries_info) # Simple success simulation
             response = SimpleNamespace(data=response_data, status=200, headers={})
-            print(f"Simulated put_messages to '{stream_id}': {count} messages.")
+            print(f"Simulated put_messages to '{stream_id}': {len(entries)} messages.")
             return response
 
         except Exception as e:
@@ -107,16 +685,155 @@ class LocalStreamClientSimulator:
             response = SimpleNamespace(data=response_data, status=500, headers={}, error=str(e))
             return response
 
-    def get_messages(self, stream_id, cursor, limit=10, **kwargs):
+    def create_cursor(self, stream_id, partition="0", type="TRIM_HORIZON", offset=None, **kwargs):
+        """
+        Creates a cursor for one partition.
+
+        Args:
+            stream_id (str): The identifier of the stream.
+            partition (str): The partition to read.
+            type (str): 'TRIM_HORIZON' (oldest message), 'LATEST' (only new messages)
+                        or 'AT_OFFSET' / 'AFTER_OFFSET' (requires offset).
+
+        Returns:
+            SimpleNamespace: 'data.value' is the cursor string.
+        """
+        log = self._get_stream(stream_id).partitions[int(partition)]
+        if type == "AT_OFFSET":
+            position = offset
+        elif type == "AFTER_OFFSET":
+            position = offset + 1
+        elif type == "LATEST":
+            position = log.end_offset
+        else:
+            position = log.start_offset
+        cursor = _encode_cursor({"p": str(partition), "o": position})
+        return SimpleNamespace(data=SimpleNamespace(value=cursor), status=200, headers={})
+
+    def create_group_cursor(self, stream_id, group_name, instance_name=None,
+                            type="TRIM_HORIZON", commit_on_get=True, **kwargs):
+        """
+        Creates a cursor for a consumer group instance.
+
+        Args:
+            stream_id (str): The identifier of the stream.
+            group_name (str): Consumers with the same group name share the partitions.
+            instance_name (str): Unique name of this consumer within the group.
+                                 Defaults to a random name.
+            type (str): Where to start in partitions the group has not committed yet:
+                        'TRIM_HORIZON' or 'LATEST'.
+            commit_on_get (bool): Commit the messages returned by the previous
+                                  get_messages call on the next call. Messages that
+                                  are still being processed are then lost if the
+                                  consumer crashes. When False, call consumer_commit()
+                                  after processing.
+
+        Returns:
+            SimpleNamespace: 'data.value' is the cursor string.
+        """
+        instance_name = instance_name or uuid.uuid4().hex
+        self._get_group(stream_id, group_name).join(instance_name, len(self._get_stream(stream_id).partitions))
+        cursor = _encode_cursor({"g": group_name, "i": instance_name, "t": type,
+                                 "c": commit_on_get, "o": {}, "r": 0})
+        return SimpleNamespace(data=SimpleNamespace(value=cursor), status=200, headers={})
+
+    def consumer_commit(self, stream_id, cursor, offsets=None, **kwargs):
+        """
+        Commits the messages read up to a group cursor, or only up to
+        `offsets` ({partition: next offset to read}) when given, e.g. the
+        messages that have finished processing.
+        """
+        state = _decode_cursor(cursor)
+        self._get_group(stream_id, state["g"]).commit(state["o"] if offsets is None else offsets)
+        return SimpleNamespace(data=SimpleNamespace(value=cursor), status=200, headers={})
+
+    def consumer_heartbeat(self, stream_id, cursor, **kwargs):
+        """Keeps a group instance alive while it is not calling get_messages."""
+        state = _decode_cursor(cursor)
+        self._get_group(stream_id, state["g"]).join(state["i"], len(self._get_stream(stream_id).partitions))
+        return SimpleNamespace(data=SimpleNamespace(value=cursor), status=200, headers={})
+
+    def leave_group(self, stream_id, cursor):
+        """Removes the instance of a group cursor so its partitions are reassigned immediately."""
+        state = _decode_cursor(cursor)
+        self._get_group(stream_id, state["g"]).leave(state["i"])
+
+    def _read_partition(self, stream_id, cursor_state, limit):
+        log = self._get_stream(stream_id).partitions[int(cursor_state["p"])]
+        messages = log.read(stream_id, cursor_state["o"], limit)
+        next_offset = messages[-1].offset + 1 if messages else max(cursor_state["o"], log.start_offset)
+        return messages, {"p": cursor_state["p"], "o": next_offset}
+
+    def _read_group(self, stream_id, cursor_state, limit):
+        stream = self._get_stream(stream_id)
+        group = self._get_group(stream_id, cursor_state["g"])
+        positions = cursor_state["o"]
+        assigned, committed = group.join(cursor_state["i"], len(stream.partitions),
+                                         positions if cursor_state["c"] else None)
+        start = {}
+        for p in assigned:
+            log = stream.partitions[int(p)]
+            if p in positions and positions[p] >= committed.get(p, 0):
+                start[p] = positions[p]
+            elif p in committed:
+                start[p] = committed[p]
+            elif cursor_state["t"] == "LATEST":
+                start[p] = log.end_offset
+            else:
+                start[p] = log.start_offset
+        # Start from a different partition on each call so no partition is starved
+        rotate = cursor_state["r"] % len(assigned) if assigned else 0
+        order = assigned[rotate:] + assigned[:rotate]
+        messages = []
+        for p in order:
+            if len(messages) >= limit:
+                break
+            batch = stream.partitions[int(p)].read(stream_id, start[p], limit - len(messages))
+            if batch:
+                start[p] = batch[-1].offset + 1
+            messages.extend(batch)
+        return messages, dict(cursor_state, o=start, r=cursor_state["r"] + 1)
+
+    def _wait_for_messages(self, stream_id, seen, deadline):
+        """
+        Block until a partition grows past `seen` or `deadline` passes.
+        put_messages in any process wakes the reader through the stream's
+        _Watcher. The segment sizes are also re-checked on a timer that starts
+        at watch_interval and doubles up to max_watch_interval, which covers
+        lost wakeups. Without Unix sockets only writes from this process wake
+        the reader; writes from other processes are then noticed by that
+        timer alone, i.e. up to max_watch_interval late.
+        """
+        stream = self._get_stream(stream_id)
+        interval = self.watch_interval
+        with stream.watcher.listen() as sock:
+            # Listening starts after `seen` was taken, so check once before waiting
+            while stream.end_offsets() == seen:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                timeout = min(remaining, interval)
+                if sock is None:
+                    with self._appended:
+                        self._appended.wait(timeout)
+                elif select.select([sock], [], [], timeout)[0]:
+                    _Watcher.drain(sock)
+                    continue
+                interval = min(interval * 2, self.max_watch_interval)
+            return True
+
+    def get_messages(self, stream_id, cursor, limit=10, timeout=0, **kwargs):
         """
-        Simulates getting messages from a stream (reads from a file).
+        Simulates getting messages from a stream.
 
         Args:
             stream_id (str): The identifier of the stream.
-            cursor (str): The position from where to start reading.
-                          In this simulation, it's the byte offset in the file.
-                          Use '0' for the beginning.
+            cursor (str): The position from where to start reading, created by
+                          create_cursor or create_group_cursor, or the
+                          'opc-next-cursor' header of the previous response.
             limit (int): Maximum number of messages to retrieve. Defaults to 10.
+            timeout (float): When no message is available, wait up to this many
+                             seconds for one to arrive (long poll). Defaults to 0.
             **kwargs: Accepts other arguments like opc_request_id for compatibility, but ignores them.
 
 
@@ -125,65 +842,25 @@ class LocalStreamClientSimulator:
                              'data' contains a list of SimulatedMessage objects.
                              'headers' contains 'opc-next-cursor'.
         """
-        file_path = self._get_stream_file_path(stream_id)
-        messages = []
-        next_cursor = cursor # Default to same cursor if no messages read
-
         try:
-            if not os.path.exists(file_path):
-                # Return empty response if stream file doesn't exist
-                response = SimpleNamespace(data=[], status=200, headers={'opc-next-cursor': cursor})
-                print(f"Simulated get_messages from '{stream_id}': Stream file not found.")
-                return response
-
-            with open(file_path, 'r', encoding='utf-8') as f:
-                try:
-                    # The cursor is the byte offset
-                    start_offset = int(cursor)
-                    f.seek(start_offset)
-                except (ValueError, TypeError):
-                    print(f"Warning: Invalid cursor '{cursor}'. Starting from beginning (offset 0).")
-                    start_offset = 0
-                    f.seek(0)
-
-                current_offset = f.tell() # Offset before reading the first line
-                line_count = 0
-                while line_count < limit:
-                    line = f.readline()
-                    if not line:
-                        # End of file reached
-                        next_cursor = str(f.tell()) # Cursor points to EOF
-                        break
-
-                    line = line.strip()
-                    if not line: # Skip empty lines if any
-                        current_offset = f.tell()
-                        continue
-
-                    try:
-                        message_data = json.loads(line)
-                        # Create a simulated message object
-                        msg = SimulatedMessage(
-                            stream=stream_id,
-                            partition="0", # Single simulated partition
-                            offset=current_offset, # Offset *before* reading this line
-                            key=message_data.get("key"), # Already base64 string or None
-                            value=message_data.get("value"), # Already base64 string
-                            timestamp=message_data.get("timestamp", time.time()) # Use stored or current time
-                        )
-                        messages.append(msg)
-                        line_count += 1
-                        current_offset = f.tell() # Update offset for the *next* potential read
-                        next_cursor = str(current_offset) # The cursor to use next time is the start of the next line
-                    except json.JSONDecodeError as jde:
-                        print(f"Warning: Skipping malformed JSON line in '{file_path}' at offset near {current_offset}: {jde}")
-                        current_offset = f.tell() # Advance past the bad line
-                        next_cursor = str(current_offset)
-                    except Exception as ex:
-                         print(f"Warning: Error processing line in '{file_path}' at offset near {current_offset}: {ex}")
-                         current_offset = f.tell() # Advance past the bad line
-                         next_cursor = str(current_offset)
+            cursor_state = _decode_cursor(cursor)
+        except (ValueError, TypeError, AttributeError):
+            print(f"Warning: Invalid cursor '{cursor}'. Starting from beginning of partition 0.")
+            cursor_state = {"p": "0", "o": 0}
 
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                # Snapshot before reading so a message appended in between still wakes us
+                seen = self._get_stream(stream_id).end_offsets()
+                if "g" in cursor_state:
+                    messages, next_state = self._read_group(stream_id, cursor_state, limit)
+                else:
+                    messages, next_state = self._read_partition(stream_id, cursor_state, limit)
+                if messages or not self._wait_for_messages(stream_id, seen, deadline):
+                    break
+                cursor_state = next_state
+            next_cursor = _encode_cursor(next_state)
 
             # Simulate the response structure
             # Real response is the list of messages directly in 'data'
@@ -193,18 +870,11 @@ class LocalStreamClientSimulator:
                 status=200,
                 headers={'opc-next-cursor': next_cursor}
             )
-            print(f"Simulated get_messages from '{stream_id}' (Cursor: {cursor}): Read {len(messages)} messages. Next cursor: {next_cursor}")
+            print(f"Simulated get_messages from '{stream_id}': Read {len(messages)} messages. Next position: {next_state['o']}")
             return response
 
-        except FileNotFoundError:
-             response = SimpleNamespace(data=[], status=200, headers={'opc-next-cursor': cursor})
-             print(f"Simulated get_messages from '{stream_id}': Stream file not found.")
-             return response
         except Exception as e:
             print(f"Error in simulated get_messages for '{stream_id}': {e}")
             # Simulate an error response (basic)
             response = SimpleNamespace(data=[], status=500, headers={'opc-next-cursor': cursor}, error=str(e))
             return response
-
-
-
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterable, Callable, Dict, Iterable, Optional, Union
+
+from config import IngestConfig, FetchConfig
+from utils.models import VideoInfo
+from utils.segment_fetcher import SegmentFetcher, segment_url
+from video_server import VideoProcessor
+
+
+class IngestionEngine:
+    """
+    视频片段并发处理引擎。
+    - 最多 MAX_CONCURRENCY 个片段同时处理，LLM 调用在同一个事件循环中并发执行
+    - 同一设备的片段严格按到达顺序处理
+    - 解码在线程池中执行（cv2 解码时释放 GIL）
+    - 未处理完的片段达到 MAX_PENDING 时暂停读取流，形成背压
+    - 片段读取后立即开始下载到本地缓存（SegmentFetcher），等待处理期间下载已完成
+    """
+
+    def __init__(self,
+                 max_concurrency: int = IngestConfig.MAX_CONCURRENCY,
+                 max_pending: int = IngestConfig.MAX_PENDING,
+                 decode_workers: int = IngestConfig.DECODE_WORKERS):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=decode_workers,
+                                           thread_name_prefix="decode")
+        self.device_locks: Dict[str, asyncio.Lock] = {}
+        self.device_pending: Dict[str, int] = {}
+        self.fetcher = SegmentFetcher() if FetchConfig.ENABLED else None
+
+    async def run(self, video_infos: Union[Iterable, AsyncIterable]):
+        """
+        消费 video_infos 直到结束。video_infos 可以是异步迭代器（例如 aget_messages），
+        也可以是阻塞的同步迭代器，后者在线程中读取。
+        元素为 VideoInfo，或 (VideoInfo, on_done)：片段处理完（包括处理失败）后调用 on_done，
+        用于在处理完成后才提交流的读取位置。
+        """
+        loop = asyncio.get_running_loop()
+        self.slots = asyncio.Semaphore(self.max_concurrency)
+        pending = asyncio.Semaphore(self.max_pending)
+        tasks = set()
+        is_async = hasattr(video_infos, '__aiter__')
+        iterator = video_infos.__aiter__() if is_async else iter(video_infos)
+        try:
+            while True:
+                await pending.acquire()
+                if is_async:
+                    try:
+                        video_info = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        video_info = None
+                else:
+                    # 同步迭代器可能阻塞，放到线程里读取，避免阻塞事件循环
+                    video_info = await loop.run_in_executor(None, next, iterator, None)
+                if video_info is None:
+                    pending.release()
+                    break
+                on_done = None
+                if isinstance(video_info, tuple):
+                    video_info, on_done = video_info
+                task = asyncio.create_task(self.process_segment(video_info, on_done))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: pending.release())
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            self.executor.shutdown(wait=False)
+            if self.fetcher is not None:
+                await self.fetcher.close()
+
+    async def process_segment(self, video_info: VideoInfo, on_done: Optional[Callable[[], None]] = None):
+        device_id = video_info.device_id
+        lock = self.device_locks.setdefault(device_id, asyncio.Lock())
+        self.device_pending[device_id] = self.device_pending.get(device_id, 0) + 1
+        url = segment_url(video_info)
+        video_source = None
+        try:
+            # 在等待设备锁和处理槽之前开始下载
+            video_source = await self._fetch(url)
+            # asyncio.Lock 按等待顺序唤醒，保证同一设备的片段按顺序处理
+            async with lock:
+                async with self.slots:
+                    await self._process(video_info, video_source)
+        except Exception as e:
+            logging.exception(f"Error processing {video_info.object_name}: {str(e)}")
+        finally:
+            if video_source is not None:
+                self.fetcher.release(url)
+            self.device_pending[device_id] -= 1
+            if self.device_pending[device_id] == 0:
+                del self.device_pending[device_id]
+                del self.device_locks[device_id]
+            if on_done is not None:
+                on_done()
+
+    async def _fetch(self, url: str) -> Optional[str]:
+        """下载片段，返回本地路径；未启用或下载失败时返回 None，由 OpenCV 直接读取 url。"""
+        if self.fetcher is None:
+            return None
+        try:
+            return await self.fetcher.fetch(url)
+        except Exception as e:
+            logging.warning(f"Failed to fetch {url}, streaming it instead: {e}")
+            return None
+
+    async def _process(self, video_info: VideoInfo, video_source: Optional[str] = None):
+        loop = asyncio.get_running_loop()
+        # 打开视频可能需要网络访问，同样放到线程池
+        processor = await loop.run_in_executor(
+            self.executor, VideoProcessor, video_info, self.executor, video_source)
+        await processor.extract_frames()
@@ -1,19 +1,32 @@
-from video_server import VideoProcessor
+from ingestion import IngestionEngine
 from utils.models import VideoInfo
-from fakestreaming.get_streaming import get_messages
+from utils.llm_client import manager
+from utils.notifier import publisher
+from fakestreaming.get_streaming import aget_messages
 import json
-import multiprocessing
 import asyncio
+import logging
 
 
-for msg in get_messages(cursor="100", limit=2):
-    data = json.loads(json.loads(msg))
-    print(data)
-    video_info = VideoInfo(**data)
+async def iter_video_info():
+    """返回 (VideoInfo, ack)，片段处理完后由 IngestionEngine 调用 ack 提交流位置。"""
+    async for msg in aget_messages():
+        try:
+            data = json.loads(json.loads(msg.value))
+            video_info = VideoInfo(**data)
+        except Exception as e:
+            logging.error(f"Skipped invalid stream message {msg.partition}/{msg.offset}: {e}")
+            msg.ack()
+            continue
+        print(data)
+        yield video_info, msg.ack
 
-    processor = VideoProcessor(video_info)
-    asyncio.run(processor.extract_frames())
-    #asyncio.run(VideoProcessor(video_info).extract_frames())
-    # # 创建并启动后台线程
-    # process  = multiprocessing.Process(target=processor.extract_frames)
-    # process.start()
\ No newline at end of file
+
+async def main():
+    # LLM 连接池在整个运行期间复用，退出时先发送完剩余通知再关闭
+    async with manager, publisher:
+        engine = IngestionEngine()
+        await engine.run(iter_video_info())
+
+
+asyncio.run(main())
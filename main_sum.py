@@ -2,10 +2,17 @@
 import asyncio
 
 from summary import EventProcessor
-import time
+from utils.llm_client import manager
 
-while True:    
-    print("="*12,"Summary Running...","="*12)
-    event_processor = EventProcessor(device_id="device_123456")
-    event_processor.process_event()
-    time.sleep(10)
\ No newline at end of file
+
+async def main():
+    # 在同一个事件循环中循环执行，LLM 连接池在各次总结之间复用
+    async with manager:
+        while True:    
+            print("="*12,"Summary Running...","="*12)
+            event_processor = EventProcessor(device_id="device_123456")
+            await event_processor.process_event()
+            await asyncio.sleep(10)
+
+
+asyncio.run(main())
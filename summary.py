@@ -1,5 +1,5 @@
 import logging 
-from config import SummaryLLMConfig, SummaryConfig, LOG_CONFIG
+from config import SummaryLLMConfig, SummaryConfig, KVConfig, LOG_CONFIG
 import time
 
 import asyncio
@@ -9,9 +9,9 @@ from utils.models import (
     timestamp_to_str
     )
 
-from fakeredis.localredis import LocalRedis
+from fakeredis.resp import connect_store
 
-kv_store = LocalRedis()
+kv_store = connect_store(KVConfig.URL)
 
 # 配置日志记录
 logging.basicConfig(
@@ -27,14 +27,14 @@ class EventProcessor:
         self.data_processor = EventDataProcessor()
 
     def get_memory_events(self):
-        device_data = kv_store.get(self.device_id)
-        if device_data is None:
+        device_data = kv_store.hgetall(self.device_id)
+        if not device_data:
             return None
         else:
             return device_data
 
 
-    def process_event(self):   
+    async def process_event(self):   
         device_data = self.get_memory_events()
         if device_data:
             current_timestamp = int(time.time() * 1000)
@@ -58,13 +58,17 @@ class EventProcessor:
                 if run_summary:
                     events_data = self.data_processor.get_events(self.device_id,k,min_time,max_time)
                     if events_data is not None:
-                        llm_data = asyncio.run(self.llm_summary(events_data))
+                        llm_data = await self.llm_summary(events_data)
                         data = self.process_data(current_timestamp,events_data,llm_data)
                         self.data_processor.save_events(data)
 
-                        device_data[k]["min_time"] = max_time
-                        device_data[k]["max_time"] = max_time
-                        kv_store.set(self.device_id,device_data)
+                        # 只关闭已总结的部分，总结期间新到的事件保留在窗口中
+                        def close_window(event_time, max_time=max_time):
+                            event_time = event_time or {}
+                            event_time["min_time"] = max_time
+                            event_time["max_time"] = max(event_time.get("max_time", max_time), max_time)
+                            return event_time
+                        kv_store.hupdate(self.device_id,k,close_window)
     
     async def llm_summary(self,events_data):
         events_context = ""
@@ -73,7 +77,7 @@ class EventProcessor:
         prompt = SummaryLLMConfig.PROMPT.format(events_context = events_context)
         print(prompt)
         messages = [{"role": "user","content": prompt}]
-        result_string = await llm_sum.call_api(messages)
+        result_string = await llm_sum.call_api(messages, self.device_id)
         # print(result_string)
         llm_data = llm_sum.convert_to_json(result_string)
         print(llm_data)    
@@ -91,38 +95,22 @@ class EventProcessor:
         data["event_summary"] = llm_data["event_summary"]
         return data
 
-import sqlite3
+from utils import database
 
 class EventDataProcessor:
     def __init__(self):
-        self.conn = sqlite3.connect('data.db')
+        # WAL 模式下读取不会被视频分析进程的写入阻塞
+        self.conn = database.connect()
         self.cur  = self.conn.cursor()
         self.init_table()
+        self.queries = database.EventQueries(self.conn)
 
     def init_table(self):
-        self.cur.execute('''
-            CREATE TABLE IF NOT EXISTS video_event_summary (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                device_id TEXT,
-                timestamp INTEGER,
-                min_timestamp INTEGER,
-                max_timestamp INTEGER,
-                event_catagory TEXT,
-                title TEXT,
-                event_summary TEXT,
-                thumbnail TEXT
-            )''')
-        self.conn.commit()
+        # 建表和索引由 database.MIGRATIONS 统一管理
+        database.migrate(self.conn)
 
     def get_events(self,device,event_catagory,min_time,max_time):
-        self.cur.execute('''
-            SELECT timestamp,description
-            FROM video_info 
-            WHERE device_id = ? and event_catagory = ? and timestamp > ? and timestamp <= ?
-            order by timestamp asc
-            ''',(device,event_catagory,min_time,max_time)
-        )
-        rows = self.cur.fetchall()
+        rows = self.queries.events(device,event_catagory,min_time,max_time)
         if not rows:
             return None
         else:
@@ -136,17 +124,8 @@ class EventDataProcessor:
             return data
     
     def get_thumbnail(self,device_id,timestamp):
-        self.cur.execute('''
-            SELECT thumbnail
-            FROM video_info 
-            WHERE device_id = ? and timestamp = ?
-            ''',(device_id,timestamp)
-        )
-        rows = self.cur.fetchone()
-        if rows:
-            return rows[0]
-        else:
-            return None
+        """返回缩略图哈希（旧数据为 data URI），需要图片时用 blob_store.load 读取。"""
+        return self.queries.thumbnail(device_id,timestamp)
     
     def save_events(self,data):
         thumbnail = self.get_thumbnail(data["device_id"],data["min_timestamp"])
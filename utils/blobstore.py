@@ -0,0 +1,74 @@
+import base64
+import binascii
+import hashlib
+import os
+import tempfile
+from typing import Optional
+
+from config import BlobConfig
+
+
+class BlobStore:
+    """
+    按内容寻址的本地文件存储。
+    文件名为内容的 sha256，存放在 root/ab/cd/<hash><ext>，相同内容只写一次。
+    目录在第一次写入时创建。
+    """
+
+    def __init__(self, root: str = BlobConfig.PATH, ext: str = ".jpg"):
+        self.root = root
+        self.ext = ext
+
+    def path(self, blob_hash: str) -> str:
+        return os.path.join(self.root, blob_hash[:2], blob_hash[2:4], blob_hash + self.ext)
+
+    def put(self, data: bytes) -> str:
+        """写入内容，返回哈希。"""
+        blob_hash = hashlib.sha256(data).hexdigest()
+        path = self.path(blob_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再改名，读取方不会看到写了一半的文件
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return blob_hash
+
+    def get(self, blob_hash: str) -> Optional[bytes]:
+        try:
+            with open(self.path(blob_hash), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def load(self, ref: Optional[str]) -> Optional[bytes]:
+        """
+        按数据库中 thumbnail 列的值加载缩略图 JPEG。
+        新数据为 blob 哈希，旧数据中直接保存的是 data URI，两种都可以读取。
+        """
+        if not ref:
+            return None
+        if ref.startswith("data:"):
+            try:
+                return base64.b64decode(ref.split(",", 1)[-1])
+            except (binascii.Error, ValueError):
+                return None
+        return self.get(ref)
+
+    def load_data_uri(self, ref: Optional[str]) -> Optional[str]:
+        """与 load 相同，返回 data URI；旧数据中的 data URI 原样返回。"""
+        if ref and ref.startswith("data:"):
+            return ref
+        data = self.load(ref)
+        if data is None:
+            return None
+        return "data:image/jpeg;base64," + base64.b64encode(data).decode("utf-8")
+
+
+blob_store = BlobStore()
@@ -0,0 +1,324 @@
+import asyncio
+import bisect
+import heapq
+import logging
+from collections import deque, OrderedDict
+from typing import Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+from config import BroadcastConfig
+from fakeredis.resp import AsyncRespClient, RespError
+from utils.models import MessagePayload, Subscription
+
+
+class ClientConnection:
+    """
+    一个 WebSocket 客户端。消息先进入该客户端自己的有界队列，由独立的写任务发送，
+    慢客户端只影响自己。队列满时按 slow_client 丢弃最旧的消息或断开连接。
+    """
+
+    def __init__(self, websocket: WebSocket,
+                 queue_size: int = BroadcastConfig.CLIENT_QUEUE_SIZE,
+                 slow_client: str = BroadcastConfig.SLOW_CLIENT,
+                 send_timeout: float = BroadcastConfig.SEND_TIMEOUT):
+        if slow_client not in ("drop_oldest", "disconnect"):
+            raise ValueError(f"Unknown slow client policy: {slow_client}")
+        self.websocket = websocket
+        self.subscription = Subscription()  # 未发送订阅时接收全部消息
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.slow_client = slow_client
+        self.send_timeout = send_timeout
+        self.dropped = 0
+        self.closed = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._writer())
+
+    def enqueue(self, message: str) -> bool:
+        """加入发送队列，不等待发送。返回 False 表示消息没有加入队列。"""
+        if self.closed:
+            return False
+        if len(self.queue) >= self.queue_size:
+            if self.slow_client == "disconnect":
+                logging.warning(f"WebSocket client {self.websocket.client} is too slow, disconnecting")
+                self.close()
+                return False
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(message)
+        self._wakeup.set()
+        return True
+
+    async def _writer(self):
+        try:
+            while True:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                message = self.queue.popleft()
+                await asyncio.wait_for(self.websocket.send_text(message), self.send_timeout)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # 客户端已断开或发送超时
+            logging.info(f"Stopped sending to WebSocket client {self.websocket.client}: {e!r}")
+        finally:
+            self.closed = True
+            self.queue.clear()
+            await self._close_socket()
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """停止发送并关闭连接，端点中的 receive 循环随之结束。"""
+        self.closed = True
+        self._task.cancel()
+
+
+class ReplayBuffer:
+    """
+    每个设备最近 size 条消息（按序号递增），客户端重连时补发 last_seq 之后的消息，
+    不需要查询数据库。最多保留 max_devices 个设备，超出时丢弃最久没有消息的设备。
+    没有序号的消息不保留。
+    local_seq 为 True 表示序号由本进程分配：客户端的序号比本进程大时说明服务重启、序号已重置；
+    序号由各 worker 共用的计数器分配时为 False，客户端领先本 worker 不代表重置。
+    """
+
+    def __init__(self, size: int = BroadcastConfig.REPLAY_SIZE,
+                 max_devices: int = BroadcastConfig.REPLAY_DEVICES):
+        self.size = size
+        self.max_devices = max_devices
+        self.devices: "OrderedDict[str, deque]" = OrderedDict()
+        self.last_seq = 0
+        self.local_seq = True
+
+    def add(self, payload: MessagePayload):
+        if payload.seq is None:
+            return
+        buffer = self.devices.pop(payload.device_id, None)
+        if buffer is None:
+            buffer = deque(maxlen=self.size)
+        if buffer and payload.seq < buffer[-1].seq:
+            # 多个 worker 并发发布时消息可能乱序到达，按序号插入，保持有序
+            index = bisect.bisect([each.seq for each in buffer], payload.seq)
+            if len(buffer) < buffer.maxlen:
+                buffer.insert(index, payload)
+            elif index > 0:
+                # 已满时丢弃最旧的一条；比保留的所有消息都旧的消息不再保留
+                buffer.popleft()
+                buffer.insert(index - 1, payload)
+        else:
+            buffer.append(payload)
+        self.devices[payload.device_id] = buffer
+        while len(self.devices) > self.max_devices:
+            self.devices.popitem(last=False)
+        self.last_seq = max(self.last_seq, payload.seq)
+
+    def since(self, last_seq: int, devices: Optional[List[str]] = None) -> List[MessagePayload]:
+        """返回 devices（None 表示所有设备）中序号大于 last_seq 的消息，按序号排序。"""
+        if last_seq > self.last_seq and self.local_seq:
+            # 客户端的序号比服务端大，说明序号已重置（服务重启），补发全部保留的消息
+            last_seq = 0
+        buffers = self.devices.values() if devices is None else \
+            [self.devices[each] for each in devices if each in self.devices]
+        # 各设备的消息已按序号排序，只需取出较新的部分再归并
+        pending = []
+        for buffer in buffers:
+            newer = []
+            for payload in reversed(buffer):
+                if payload.seq <= last_seq:
+                    break
+                newer.append(payload)
+            newer.reverse()
+            pending.append(newer)
+        return list(heapq.merge(*pending, key=lambda payload: payload.seq))
+
+
+class Broadcaster:
+    """
+    把消息推送给订阅了它的 WebSocket 客户端。
+    客户端按订阅的设备建立索引，每条消息只检查订阅了该设备（或所有设备）的客户端；
+    消息按是否包含缩略图最多序列化两次，同一份字符串放入各客户端的队列后立即返回，
+    推送延迟不受最慢客户端影响。
+    订阅条件带 last_seq 时，先从 ReplayBuffer 补发之后的消息再接收新消息，不会遗漏或重复。
+    """
+
+    def __init__(self):
+        self.clients: Set[ClientConnection] = set()
+        self.replay = ReplayBuffer()
+        self.by_device: Dict[str, Set[ClientConnection]] = {}
+        self.all_devices: Set[ClientConnection] = set()
+
+    def register(self, websocket: WebSocket) -> ClientConnection:
+        client = ClientConnection(websocket)
+        self.clients.add(client)
+        self._index(client)
+        return client
+
+    def unregister(self, client: ClientConnection):
+        self.clients.discard(client)
+        self._unindex(client)
+        client.close()
+
+    def subscribe(self, client: ClientConnection, subscription: Subscription):
+        """替换客户端的订阅条件，带 last_seq 时补发之后的消息。"""
+        self._unindex(client)
+        client.subscription = subscription
+        if client not in self.clients:
+            return
+        self._index(client)
+        if subscription.last_seq is not None:
+            # 补发和之后的 broadcast 都在事件循环中执行，中间不会插入新消息
+            replayed = 0
+            for payload in self.replay.since(subscription.last_seq, subscription.devices):
+                if subscription.accepts(payload):
+                    client.enqueue(self._serialize(payload, subscription.thumbnail))
+                    replayed += 1
+            logging.info(f"Replayed {replayed} messages after seq {subscription.last_seq} to {client.websocket.client}")
+
+    @staticmethod
+    def _serialize(payload: MessagePayload, thumbnail: bool) -> str:
+        return payload.model_dump_json(exclude=None if thumbnail else {"thumbnail"})
+
+    def _index(self, client: ClientConnection):
+        devices = client.subscription.devices
+        if devices is None:
+            self.all_devices.add(client)
+        else:
+            for device_id in devices:
+                self.by_device.setdefault(device_id, set()).add(client)
+
+    def _unindex(self, client: ClientConnection):
+        self.all_devices.discard(client)
+        for device_id in client.subscription.devices or []:
+            subscribers = self.by_device.get(device_id)
+            if subscribers is not None:
+                subscribers.discard(client)
+                if not subscribers:
+                    del self.by_device[device_id]
+
+    def broadcast(self, payload: MessagePayload) -> int:
+        """返回加入了发送队列的客户端数。"""
+        self.replay.add(payload)
+        candidates = self.all_devices | self.by_device.get(payload.device_id, set())
+        messages = {}  # 是否包含缩略图 -> JSON
+        count = 0
+        for client in candidates:
+            subscription = client.subscription
+            if not subscription.accepts(payload):
+                continue
+            if subscription.thumbnail not in messages:
+                messages[subscription.thumbnail] = self._serialize(payload, subscription.thumbnail)
+            if client.enqueue(messages[subscription.thumbnail]):
+                count += 1
+            elif client.closed:
+                self.unregister(client)
+        return count
+
+
+broadcaster = Broadcaster()
+
+
+class NotificationHub:
+    """
+    多个 api.py worker 共用的消息分发。
+    配置了 backplane_url 时，收到的消息先发布到 pub/sub 频道，每个 worker 订阅该频道，
+    再推送给自己的客户端，无论 /sendjson 请求落在哪个 worker，所有客户端都能收到；
+    未配置或发布失败时只推送给本进程的客户端。订阅连接断开时按退避重连，期间的消息会丢失。
+    每条消息在发布前分配序号：有 backplane 时由 KV 服务的计数器（INCRBY）分配，各 worker 一致，
+    同一 worker 内分配和发布在一个锁内完成，按序号顺序发布；发布失败时消息不带序号，只推送、不补发，
+    避免与其它 worker 的序号冲突。未配置 backplane 时使用本进程的计数器。
+
+    用法（FastAPI lifespan）：
+        await hub.start()
+        ...
+        await hub.stop()
+    """
+
+    def __init__(self, broadcaster: Broadcaster,
+                 backplane_url: Optional[str] = BroadcastConfig.BACKPLANE_URL,
+                 channel: str = BroadcastConfig.CHANNEL,
+                 seq_key: str = BroadcastConfig.SEQ_KEY):
+        self.broadcaster = broadcaster
+        self.backplane_url = backplane_url
+        self.channel = channel
+        self.seq_key = seq_key
+        self.client = None
+        self._task = None
+        self._publish_lock = None
+
+    async def start(self):
+        if self.backplane_url:
+            self.client = AsyncRespClient.from_url(self.backplane_url)
+            self._publish_lock = asyncio.Lock()
+            self.broadcaster.replay.local_seq = False
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    def _number(self, payloads: List[MessagePayload], last_seq: int) -> List[MessagePayload]:
+        first = last_seq - len(payloads) + 1
+        return [payload.model_copy(update={"seq": first + i}) for i, payload in enumerate(payloads)]
+
+    async def publish(self, payloads: List[MessagePayload]):
+        """分发一批消息，按顺序分配序号并发布。"""
+        if not payloads:
+            return
+        if self.client is not None:
+            try:
+                # 其它请求不能在分配序号和发布之间插入，否则会先发布较大的序号
+                async with self._publish_lock:
+                    last_seq = await self.client.execute('INCRBY', self.seq_key, len(payloads))
+                    commands = [('PUBLISH', self.channel, payload.model_dump_json())
+                                for payload in self._number(payloads, last_seq)]
+                    replies = await self.client.execute_many(commands)
+                # 单条 PUBLISH 出错时其余消息已经发布，只把出错的消息推送给本进程的客户端
+                errors = [reply for reply in replies if isinstance(reply, RespError)]
+                if not errors:
+                    return
+                logging.error(f"Publishing {len(errors)} of {len(payloads)} messages to {self.backplane_url} failed, "
+                              f"delivering them to local clients only: {errors[0]!r}")
+                payloads = [payload for payload, reply in zip(payloads, replies) if isinstance(reply, RespError)]
+            except (OSError, ConnectionError, RespError, asyncio.TimeoutError) as e:
+                logging.error(f"Publishing to {self.backplane_url} failed, delivering to local clients only: {e!r}")
+            for payload in payloads:
+                self.broadcaster.broadcast(payload.model_copy(update={"seq": None}))
+            return
+        last_seq = self.broadcaster.replay.last_seq + len(payloads)
+        for payload in self._number(payloads, last_seq):
+            self.broadcaster.broadcast(payload)
+
+    async def _listen(self):
+        delay = 0.5
+        while True:
+            try:
+                async for _, data in self.client.subscribe(self.channel):
+                    delay = 0.5
+                    try:
+                        self.broadcaster.broadcast(MessagePayload.model_validate_json(data))
+                    except ValueError as e:
+                        logging.error(f"Invalid message on channel {self.channel}: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Subscription to {self.backplane_url} lost, retrying in {delay:.1f}s: {e!r}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+
+
+hub = NotificationHub(broadcaster)
@@ -0,0 +1,160 @@
+import cv2
+import numpy as np
+
+from config import VideoConfig
+
+
+class ChangeDetector:
+    """
+    关键帧检测接口。
+    prepare 把帧缩放为小尺寸灰度特征，similarity 比较两个特征，返回值越大越相似（1 表示相同）。
+    检测器内部缓存并复用 float32 工作缓冲区，同一个实例不能在多个线程中同时使用。
+    """
+
+    def __init__(self, width: int = VideoConfig.DETECT_WIDTH):
+        self.width = width
+        self._small = None
+        self._gray = None
+
+    def _downscale_gray(self, frame: np.ndarray, size=None) -> np.ndarray:
+        h, w = frame.shape[:2]
+        if size is None:
+            if w > self.width:
+                size = (self.width, max(1, round(h * self.width / w)))
+            else:
+                size = (w, h)
+        if frame.ndim == 3:
+            # 先缩放再转灰度，避免分配整帧大小的灰度图
+            if self._small is None or self._small.shape[:2] != (size[1], size[0]):
+                self._small = np.empty((size[1], size[0], frame.shape[2]), dtype=np.uint8)
+            cv2.resize(frame, size, dst=self._small, interpolation=cv2.INTER_AREA)
+            if self._gray is None or self._gray.shape != (size[1], size[0]):
+                self._gray = np.empty((size[1], size[0]), dtype=np.uint8)
+            cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+            return self._gray
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def prepare(self, frame: np.ndarray):
+        """返回帧的特征，特征会作为上一关键帧保留，不能引用内部缓冲区。"""
+        return self._downscale_gray(frame).astype(np.float32)
+
+    def similarity(self, prev_feature, feature) -> float:
+        raise NotImplementedError
+
+    def compare(self, prev_feature, frame: np.ndarray):
+        """提取 frame 的特征并与 prev_feature 比较，返回 (相似度, 特征)。prev_feature 为 None 时相似度为 0。"""
+        feature = self.prepare(frame)
+        if prev_feature is None:
+            return 0, feature
+        return self.similarity(prev_feature, feature), feature
+
+    def _buffers(self, shape, count):
+        buffers = getattr(self, "_work", None)
+        if buffers is None or buffers[0].shape != shape:
+            buffers = [np.empty(shape, dtype=np.float32) for _ in range(count)]
+            self._work = buffers
+        return buffers
+
+
+class SSIMDetector(ChangeDetector):
+    """
+    窗口 SSIM（高斯窗口 7x7，sigma 1.5），对局部变化比全局 SSIM 敏感。
+    SSIM by Z. Wang: https://ece.uwaterloo.ca/~z70wang/research/ssim/
+    """
+    K1 = 0.01
+    K2 = 0.03
+    L = 255
+    KSIZE = (7, 7)
+    SIGMA = 1.5
+
+    def similarity(self, prev_feature, feature) -> float:
+        a, b = prev_feature, feature
+        if a.shape != b.shape:
+            return 0.0
+        C1 = (self.K1 * self.L) ** 2
+        C2 = (self.K2 * self.L) ** 2
+        mu1, mu2, s1, s2, s12, tmp = self._buffers(a.shape, 6)
+
+        cv2.GaussianBlur(a, self.KSIZE, self.SIGMA, dst=mu1)
+        cv2.GaussianBlur(b, self.KSIZE, self.SIGMA, dst=mu2)
+
+        # sigma1^2, sigma2^2, sigma12
+        np.multiply(a, a, out=tmp)
+        cv2.GaussianBlur(tmp, self.KSIZE, self.SIGMA, dst=s1)
+        s1 -= np.multiply(mu1, mu1, out=tmp)
+        np.multiply(b, b, out=tmp)
+        cv2.GaussianBlur(tmp, self.KSIZE, self.SIGMA, dst=s2)
+        s2 -= np.multiply(mu2, mu2, out=tmp)
+        np.multiply(a, b, out=tmp)
+        cv2.GaussianBlur(tmp, self.KSIZE, self.SIGMA, dst=s12)
+        s12 -= np.multiply(mu1, mu2, out=tmp)
+
+        # (2*mu1*mu2 + C1) * (2*sigma12 + C2)
+        np.multiply(mu1, mu2, out=tmp)
+        tmp *= 2
+        tmp += C1
+        s12 *= 2
+        s12 += C2
+        tmp *= s12
+
+        # (mu1^2 + mu2^2 + C1) * (sigma1^2 + sigma2^2 + C2)
+        np.square(mu1, out=mu1)
+        np.square(mu2, out=mu2)
+        mu1 += mu2
+        mu1 += C1
+        s1 += s2
+        s1 += C2
+        mu1 *= s1
+
+        tmp /= mu1
+        return float(tmp.mean())
+
+
+class MADDetector(ChangeDetector):
+    """平均绝对差，最便宜的检测方法，相似度 = 1 - mean(|a - b|) / 255。"""
+
+    def similarity(self, prev_feature, feature) -> float:
+        if prev_feature.shape != feature.shape:
+            return 0.0
+        (tmp,) = self._buffers(feature.shape, 1)
+        np.subtract(prev_feature, feature, out=tmp)
+        np.abs(tmp, out=tmp)
+        return 1.0 - float(tmp.mean()) / 255
+
+
+class PHashDetector(ChangeDetector):
+    """感知哈希（DCT 64 位），相似度 = 1 - 汉明距离 / 64。特征为 int，可直接作为缓存键。"""
+
+    def prepare(self, frame: np.ndarray) -> int:
+        return phash(frame, self)
+
+    def similarity(self, prev_feature: int, feature: int) -> float:
+        return 1.0 - hamming_distance(prev_feature, feature) / 64
+
+
+def phash(frame: np.ndarray, detector: ChangeDetector = None) -> int:
+    """计算帧的 64 位感知哈希。"""
+    if detector is None:
+        detector = ChangeDetector()
+    gray = detector._downscale_gray(frame, size=(32, 32)).astype(np.float32)
+    low = cv2.dct(gray)[:8, :8].flatten()
+    # 不计直流分量，避免整体亮度影响中位数
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+DETECTORS = {
+    "ssim": SSIMDetector,
+    "mad": MADDetector,
+    "phash": PHashDetector,
+}
+
+
+def create_detector(metric: str = VideoConfig.CHANGE_METRIC) -> ChangeDetector:
+    if metric not in DETECTORS:
+        raise ValueError(f"Unknown change metric: {metric}, expected one of {list(DETECTORS)}")
+    return DETECTORS[metric]()
@@ -0,0 +1,303 @@
+import asyncio
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict
+
+from config import DBConfig
+
+
+def connect(path: str = DBConfig.PATH, **kwargs) -> sqlite3.Connection:
+    """打开 SQLite 连接并启用 WAL，读写进程之间不再互相阻塞。"""
+    kwargs.setdefault('cached_statements', DBConfig.CACHED_STATEMENTS)
+    conn = sqlite3.connect(path, **kwargs)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={int(DBConfig.BUSY_TIMEOUT)}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute(f'PRAGMA cache_size=-{int(DBConfig.CACHE_SIZE_KB)}')
+    return conn
+
+
+# 数据库结构迁移，按顺序执行，已执行到的版本记录在 PRAGMA user_version 中。
+# 旧数据库（user_version 为 0 但已有表）会跳过已存在的表，只补建索引。
+MIGRATIONS = [
+    # 1: 帧信息表
+    ['''
+        CREATE TABLE IF NOT EXISTS video_info (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT,
+            timestamp INTEGER,
+            object_name TEXT,
+            ssim REAL,
+            thumbnail TEXT,
+            description TEXT,
+            event_catagory TEXT,
+            triger_alarm REAL,
+            is_new_event BOOLEAN
+        )'''],
+    # 2: 事件总结表
+    ['''
+        CREATE TABLE IF NOT EXISTS video_event_summary (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT,
+            timestamp INTEGER,
+            min_timestamp INTEGER,
+            max_timestamp INTEGER,
+            event_catagory TEXT,
+            title TEXT,
+            event_summary TEXT,
+            thumbnail TEXT
+        )'''],
+    # 3: 按设备、事件类型、时间范围查询事件；按设备和时间查询缩略图
+    ['''
+        CREATE INDEX IF NOT EXISTS idx_video_info_device_category_ts
+        ON video_info (device_id, event_catagory, timestamp)''',
+     '''
+        CREATE INDEX IF NOT EXISTS idx_video_info_device_ts
+        ON video_info (device_id, timestamp)'''],
+    # 4: Web UI 按时间倒序分页加载历史事件
+    ['''
+        CREATE INDEX IF NOT EXISTS idx_video_info_ts
+        ON video_info (timestamp)'''],
+]
+
+
+def migrate(conn: sqlite3.Connection, migrations: list = MIGRATIONS):
+    """把数据库升级到最新结构，多个进程同时执行时由写锁串行化。"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for i in range(version, len(migrations)):
+            for sql in migrations[i]:
+                conn.execute(sql)
+            logging.info(f"Migrated database to version {i + 1}")
+        conn.execute(f'PRAGMA user_version={len(migrations)}')
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+class EventQueries:
+    """
+    video_info 的查询。SQL 文本固定，sqlite3 的语句缓存会复用编译好的语句；
+    各查询都能使用 MIGRATIONS 中建立的索引。
+    """
+    EVENTS_SQL = '''
+        SELECT timestamp, description
+        FROM video_info
+        WHERE device_id = ? AND event_catagory = ? AND timestamp > ? AND timestamp <= ?
+        ORDER BY timestamp ASC'''
+    THUMBNAIL_SQL = '''
+        SELECT thumbnail
+        FROM video_info
+        WHERE device_id = ? AND timestamp = ?
+        LIMIT 1'''
+    RECENT_SQL = '''
+        SELECT device_id, timestamp, thumbnail, description, event_catagory, triger_alarm
+        FROM video_info
+        WHERE timestamp < ?
+        ORDER BY timestamp DESC
+        LIMIT ?'''
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def events(self, device_id: str, event_catagory: str, min_time: int, max_time: int) -> list:
+        """返回 (timestamp, description) 列表，时间范围为 (min_time, max_time]。"""
+        return self.conn.execute(self.EVENTS_SQL, (device_id, event_catagory, min_time, max_time)).fetchall()
+
+    def thumbnail(self, device_id: str, timestamp: int):
+        row = self.conn.execute(self.THUMBNAIL_SQL, (device_id, timestamp)).fetchone()
+        return row[0] if row else None
+
+    def recent(self, before: int, limit: int) -> list:
+        """返回时间早于 before 的最近 limit 条事件，按时间倒序。"""
+        return self.conn.execute(self.RECENT_SQL, (before, limit)).fetchall()
+
+
+class SQLiteWriter:
+    """
+    SQLite 专用写线程。
+    写入语句先进入队列，写线程按条数（batch_size）或时间（flush_interval）合并为一个事务提交，
+    调用方不等待 fsync。语句按提交顺序执行，进程退出时自动写完队列中剩余的语句。
+    enqueue 返回的 future 在该语句所在事务提交后完成，需要“写入后再做”的操作可以等待它。
+    写线程启动时先执行 migrate（其它数据库文件可传入自己的 migrations）；打开数据库或迁移失败时，
+    之后的 submit/enqueue/flush 抛出 RuntimeError（原异常为 __cause__），不会无限等待。
+    """
+
+    def __init__(self, path: str = DBConfig.PATH,
+                 batch_size: int = DBConfig.BATCH_SIZE,
+                 flush_interval: float = DBConfig.FLUSH_INTERVAL,
+                 queue_size: int = DBConfig.QUEUE_SIZE,
+                 migrations: list = MIGRATIONS):
+        self.path = path
+        self.migrations = migrations
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name=f"sqlite-writer-{path}", daemon=True)
+        self.thread.start()
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError(f"SQLiteWriter for {self.path} failed to start: {self.error}") from self.error
+        if self.closed:
+            raise RuntimeError(f"SQLiteWriter for {self.path} is closed")
+
+    def submit(self, sql: str, params=(), done=None):
+        """
+        加入写入队列，队列满时阻塞。
+        done(error) 在写线程中调用：语句提交后 error 为 None，被丢弃时为对应异常。
+        """
+        self._check()
+        self.queue.put((sql, params, done))
+
+    def submit_nowait(self, sql: str, params=(), done=None):
+        """加入写入队列，不阻塞，队列满时抛出 queue.Full。可以在事件循环中调用。"""
+        self._check()
+        self.queue.put_nowait((sql, params, done))
+
+    async def enqueue(self, sql: str, params=()) -> asyncio.Future:
+        """
+        异步加入写入队列，队列满时在线程池中等待，不阻塞事件循环。
+        返回的 future 在语句提交后完成，语句被丢弃时抛出对应异常。
+        """
+        loop = asyncio.get_running_loop()
+        committed = loop.create_future()
+        # 写线程已记录被丢弃的语句，调用方不等待 future 时不再报 "exception was never retrieved"
+        committed.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        def resolve(error):
+            if committed.done():
+                return
+            if error is None:
+                committed.set_result(None)
+            else:
+                committed.set_exception(error)
+
+        def done(error):
+            try:
+                loop.call_soon_threadsafe(resolve, error)
+            except RuntimeError:
+                # 事件循环已关闭，没有人再等待结果
+                pass
+
+        try:
+            self.submit_nowait(sql, params, done)
+        except queue.Full:
+            await loop.run_in_executor(None, self.submit, sql, params, done)
+        return committed
+
+    def flush(self):
+        """等待队列中已有的语句全部提交。"""
+        self.queue.join()
+        if self.error is not None:
+            self._check()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        try:
+            conn = connect(self.path)
+            migrate(conn, self.migrations)
+        except Exception as e:
+            logging.exception(f"SQLiteWriter for {self.path} failed to start")
+            self.error = e
+            self._discard()
+            return
+        stop = False
+        while not stop:
+            item = self.queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while item is not None and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+            if batch[-1] is None:
+                stop = True
+            statements = [each for each in batch if each is not None]
+            if statements:
+                self._write(conn, statements)
+            for _ in batch:
+                self.queue.task_done()
+        conn.close()
+
+    def _discard(self):
+        """启动失败后丢弃队列中的语句，让 flush、阻塞的 submit 和等待提交的 future 返回。"""
+        while True:
+            item = self.queue.get()
+            if item is not None:
+                self._notify(item, RuntimeError(f"SQLiteWriter for {self.path} failed to start: {self.error}"))
+            self.queue.task_done()
+            if item is None:
+                break
+
+    def _notify(self, item, error):
+        done = item[2]
+        if done is None:
+            return
+        try:
+            done(error)
+        except Exception:
+            logging.exception(f"SQLiteWriter for {self.path}: commit callback failed")
+
+    def _write(self, conn: sqlite3.Connection, statements: list):
+        try:
+            with conn:
+                for sql, params, _ in statements:
+                    conn.execute(sql, params)
+        except sqlite3.Error as e:
+            # 整批回滚后逐条重试，只丢弃出错的语句
+            logging.error(f"Batch write to {self.path} failed ({e}), retrying one by one")
+            for item in statements:
+                sql, params, _ = item
+                try:
+                    with conn:
+                        conn.execute(sql, params)
+                except sqlite3.Error as e:
+                    logging.error(f"Dropped write to {self.path}: {e}: {sql.strip()[:80]}")
+                    self._notify(item, e)
+                else:
+                    self._notify(item, None)
+            return
+        for item in statements:
+            self._notify(item, None)
+
+
+_writers: Dict[str, SQLiteWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path: str = DBConfig.PATH) -> SQLiteWriter:
+    """同一进程内每个数据库文件共用一个写线程。"""
+    with _writers_lock:
+        if path not in _writers:
+            _writers[path] = SQLiteWriter(path)
+        return _writers[path]
+
+
+@atexit.register
+def close_writers():
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
@@ -3,25 +3,38 @@ import asyncio
 from openai import OpenAI,AsyncOpenAI
 import json
 import time
-from config import LLMConfig
-import httpx
-
-client = AsyncOpenAI(
-    api_key = LLMConfig.API_KEY,
-    base_url = LLMConfig.BASE_URL
-    )
+import logging
+from typing import Dict
+from config import LLMConfig, LLMClientConfig, LLMSchedulerConfig
+from utils.llm_client import manager
+from utils.llm_scheduler import scheduler, PRIORITY_ALARM, PRIORITY_LIVE
 
 is_fake = True
 
-async def call_api(messages: list) -> str:
+def count_images(messages: list) -> int:
+    count = 0
+    for message in messages:
+        if isinstance(message["content"], list):
+            count += sum(1 for each in message["content"] if each.get("type") == "image_url")
+    return count
+
+async def call_api(messages: list, priority: int = PRIORITY_LIVE, device_id: str = "") -> str:
+    """经调度器限流后调用模型。"""
+    return await scheduler.run(_request, messages, priority=priority, device_id=device_id)
+
+async def _request(messages: list) -> str:
     if is_fake:
-        async with httpx.AsyncClient() as client:
-            response = await client.get("http://localhost:8088/fakellm")
-            result_string = response.text
-            return result_string
+        client = manager.http_client(LLMClientConfig.FAKE_LLM_URL)
+        # fakellm 按图片数返回对应条数的结果
+        response = await client.get(LLMClientConfig.FAKE_LLM_URL,
+                                    params={"n": max(count_images(messages), 1)})
+        response.raise_for_status()
+        result_string = response.text
+        return result_string
     
 
     else:
+        client = manager.openai_client(LLMConfig.BASE_URL, LLMConfig.API_KEY)
         model_id = LLMConfig.MODEL_ID
         #print("Model id:", model_id)
         completion = await client.chat.completions.create(
@@ -34,24 +47,152 @@ async def call_api(messages: list) -> str:
         result_string = completion.choices[0].message.content
         return result_string
 
-async def video_analyzer(images_data: list, previous_events: str = "") -> str:
-    """Handle the service call to analyze a video (future implementation)"""
-
-    prompt = LLMConfig.PROMPT.format(previous_events = previous_events)
-    # print(prompt)
-
+def build_messages(prompt: str, images_data: list) -> list:
     content = [{"type": "text", "text": prompt}]
     for each in images_data:
         content.append({
             "type": "image_url",
             "image_url": {"url": each}
             })
+    return [{"role": "user","content": content}]
+
+async def video_analyzer(images_data: list, previous_events: str = "",
+                         priority: int = PRIORITY_LIVE, device_id: str = "") -> str:
+    """Handle the service call to analyze a video (future implementation)"""
 
-    messages = [{"role": "user","content": content}]    
-    result_string = await call_api(messages)
+    prompt = LLMConfig.PROMPT.format(previous_events = previous_events)
+    # print(prompt)
+
+    messages = build_messages(prompt, images_data)
+    result_string = await call_api(messages, priority, device_id)
     return result_string
 
+async def batch_analyzer(images_data: list, previous_events: str = "",
+                         priority: int = PRIORITY_LIVE, device_id: str = "") -> list:
+    """一个请求分析多张图片，返回与 images_data 一一对应的结果列表。"""
+    prompt = LLMConfig.BATCH_PROMPT.format(count = len(images_data),
+                                           previous_events = previous_events)
+    messages = build_messages(prompt, images_data)
+    result_string = await call_api(messages, priority, device_id)
+    data = convert_to_json(result_string)
+    if isinstance(data, dict):
+        # 模型有时会把数组包在一个对象里
+        lists = [v for v in data.values() if isinstance(v, list)]
+        data = lists[0] if len(lists) == 1 else [data]
+    return data
+
 def convert_to_json(json_string: str) -> dict:    
     json_str = json_string.strip().strip('```json').strip('```').strip()
     data = json.loads(json_str)    
     return data
+
+
+class FrameBatcher:
+    """
+    把同一设备短时间内的关键帧合并为一个多图请求，再把结果分发给各帧。
+    凑满 max_size 张或等待 max_wait 秒后发送；模型返回的条数不对时逐张重新分析。
+    设备最近一次结果的 trigger_alarm 达到 ALARM_THRESHOLD 时，后续请求以报警优先级调度。
+    没有待发送和进行中的请求超过 idle_ttl 秒后从 batchers 中移除。
+    """
+
+    def __init__(self, device_id: str = "", max_size: int = LLMConfig.BATCH_SIZE, max_wait: float = LLMConfig.BATCH_WINDOW,
+                 idle_ttl: float = LLMConfig.BATCHER_IDLE_TTL):
+        self.device_id = device_id
+        self.last_alarm = 0.0
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.idle_ttl = idle_ttl
+        self.pending = []
+        self.previous_events = ""
+        self.timer = None
+        self.idle_timer = None
+        self.tasks = set()
+
+    def submit(self, image_data: str, previous_events: str = "") -> asyncio.Future:
+        """加入待发送队列，返回该图片分析结果(dict)的 future。"""
+        loop = asyncio.get_running_loop()
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+        if self.pending and previous_events != self.previous_events:
+            self.flush()
+        self.previous_events = previous_events
+        future = loop.create_future()
+        self.pending.append((image_data, future))
+        if len(self.pending) >= self.max_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_wait, self.flush)
+        return future
+
+    async def analyze(self, image_data: str, previous_events: str = "") -> dict:
+        return await self.submit(image_data, previous_events)
+
+    def flush(self):
+        """立即发送已收集的图片，片段结束时调用可以省去等待时间。"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            self._check_idle()
+            return
+        batch, self.pending = self.pending, []
+        task = asyncio.create_task(self._run(batch, self.previous_events))
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        self._check_idle()
+
+    def _check_idle(self):
+        """没有待发送和进行中的请求时，idle_ttl 秒后移除。"""
+        if self.pending or self.tasks or self.timer is not None or self.idle_timer is not None:
+            return
+        self.idle_timer = asyncio.get_running_loop().call_later(self.idle_ttl, self._expire)
+
+    def _expire(self):
+        self.idle_timer = None
+        if not self.pending and not self.tasks and batchers.get(self.device_id) is self:
+            del batchers[self.device_id]
+
+    @property
+    def priority(self) -> int:
+        if self.last_alarm >= LLMSchedulerConfig.ALARM_THRESHOLD:
+            return PRIORITY_ALARM
+        return PRIORITY_LIVE
+
+    async def _run(self, batch: list, previous_events: str):
+        images_data = [image_data for image_data, _ in batch]
+        priority = self.priority
+        try:
+            if len(batch) == 1:
+                results = [convert_to_json(await video_analyzer(images_data, previous_events, priority, self.device_id))]
+            else:
+                results = await batch_analyzer(images_data, previous_events, priority, self.device_id)
+                if len(results) != len(batch):
+                    logging.warning(f"Batch analysis returned {len(results)} results for {len(batch)} images, retrying one by one")
+                    results = await asyncio.gather(*[
+                        video_analyzer([each], previous_events, priority, self.device_id) for each in images_data])
+                    results = [convert_to_json(each) for each in results]
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        try:
+            self.last_alarm = float(results[-1].get("trigger_alarm", 0))
+        except (AttributeError, TypeError, ValueError):
+            pass
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+batchers: Dict[str, FrameBatcher] = {}
+
+def get_batcher(key: str) -> FrameBatcher:
+    """按设备共享 FrameBatcher，空闲的 FrameBatcher 会被移除，之后再次创建。只在事件循环中调用。"""
+    if key not in batchers:
+        batchers[key] = FrameBatcher(device_id=key)
+    return batchers[key]
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import queue
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config import LLMConfig, LLMCacheConfig
+from utils import database
+from utils.change_detection import hamming_distance
+
+
+def _version(*parts: str) -> str:
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()[:12]
+
+
+# 模型和固定提示词的版本号，模块加载时计算一次
+PROMPT_VERSION = _version(LLMConfig.MODEL_ID, LLMConfig.PROMPT, LLMConfig.BATCH_PROMPT)
+
+
+def prompt_version(*parts: str) -> str:
+    """模型和提示词的版本号，任一部分变化时缓存自动失效。没有可变部分时直接返回 PROMPT_VERSION。"""
+    if not any(parts):
+        return PROMPT_VERSION
+    return _version(PROMPT_VERSION, *parts)
+
+
+# 缓存数据库的结构，与 utils.database.MIGRATIONS 相同的格式
+MIGRATIONS = [
+    ['''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            version TEXT,
+            hash TEXT,
+            result TEXT,
+            created REAL,
+            PRIMARY KEY (version, hash)
+        )'''],
+]
+
+
+class LLMResultCache:
+    """
+    LLM 分析结果缓存，键为帧的 64 位感知哈希加提示词/模型版本。
+    - 汉明距离不超过 max_distance 的帧视为相同画面，返回其中距离最小且未过期的结果
+    - 近似查找使用多索引哈希：哈希分为 max_distance + 1 段，距离不超过 max_distance 的两个哈希
+      至少有一段完全相同，只需比较与查询哈希有相同分段的条目，不扫描全部缓存
+    - 最多 max_size 条，按 LRU 淘汰，超过 ttl 秒过期
+    - 指定 path 时由 SQLiteWriter 写线程写入 SQLite，不阻塞事件循环，重启后加载未过期的结果
+    """
+
+    def __init__(self,
+                 max_size: int = LLMCacheConfig.MAX_SIZE,
+                 ttl: float = LLMCacheConfig.TTL,
+                 max_distance: int = LLMCacheConfig.MAX_DISTANCE,
+                 path: Optional[str] = LLMCacheConfig.PERSIST_PATH):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_distance = max_distance
+        # 每段的 (起始位, 掩码)
+        bands = max_distance + 1
+        self.bands = [(64 * i // bands, (1 << (64 * (i + 1) // bands - 64 * i // bands)) - 1)
+                      for i in range(bands)]
+        # (version, hash) -> (result, created)
+        self.entries = OrderedDict()
+        # (version, 段序号, 段的值) -> 该段取值相同的 (version, hash)
+        self.buckets = {}
+        self.hits = 0
+        self.misses = 0
+        self.writer = None
+        if path:
+            conn = database.connect(path)
+            try:
+                database.migrate(conn, MIGRATIONS)
+                self._load(conn)
+            finally:
+                conn.close()
+            self.writer = database.SQLiteWriter(path, migrations=MIGRATIONS)
+
+    def _load(self, conn):
+        with conn:
+            conn.execute('DELETE FROM llm_cache WHERE created < ?', (time.time() - self.ttl,))
+        rows = conn.execute('''
+            SELECT version, hash, result, created FROM llm_cache
+            ORDER BY created DESC LIMIT ?''', (self.max_size,)).fetchall()
+        for version, frame_hash, result, created in reversed(rows):
+            self._add((version, int(frame_hash, 16)), json.loads(result), created)
+        logging.info(f"Loaded {len(rows)} cached LLM results")
+
+    def _bucket_keys(self, key):
+        version, frame_hash = key
+        return [(version, i, (frame_hash >> shift) & mask) for i, (shift, mask) in enumerate(self.bands)]
+
+    def _add(self, key, result, created):
+        if key not in self.entries:
+            for bucket in self._bucket_keys(key):
+                self.buckets.setdefault(bucket, set()).add(key)
+        self.entries[key] = (result, created)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        del self.entries[key]
+        for bucket in self._bucket_keys(key):
+            keys = self.buckets[bucket]
+            keys.discard(key)
+            if not keys:
+                del self.buckets[bucket]
+
+    def _valid(self, key, now) -> bool:
+        """条目存在且未过期；过期的条目顺便删除。"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        if now - entry[1] > self.ttl:
+            self._remove(key)
+            return False
+        return True
+
+    def _nearest(self, frame_hash: int, version: str, now: float):
+        best = None
+        candidates = set()
+        for bucket in self._bucket_keys((version, frame_hash)):
+            candidates.update(self.buckets.get(bucket, ()))
+        for other in candidates:
+            distance = hamming_distance(other[1], frame_hash)
+            if distance <= self.max_distance and (best is None or distance < best[0]) and self._valid(other, now):
+                best = (distance, other)
+        return best[1] if best is not None else None
+
+    def get(self, frame_hash: int, version: str) -> Optional[dict]:
+        now = time.time()
+        key = (version, frame_hash)
+        if not self._valid(key, now):
+            key = self._nearest(frame_hash, version, now) if self.max_distance > 0 else None
+        if key is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return dict(self.entries[key][0])
+
+    def put(self, frame_hash: int, version: str, result: dict):
+        """在事件循环中调用（分析结果的 done-callback），写入队列满时只保留内存中的结果，不等待。"""
+        now = time.time()
+        self._add((version, frame_hash), dict(result), now)
+        if self.writer is not None:
+            try:
+                self.writer.submit_nowait('INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)',
+                                          (version, format(frame_hash, "016x"), json.dumps(result, ensure_ascii=False), now))
+            except queue.Full:
+                logging.warning("LLM cache write queue is full, result kept in memory only")
+            except RuntimeError as e:
+                logging.warning(f"LLM cache result not persisted: {e}")
+
+
+cache = LLMResultCache() if LLMCacheConfig.ENABLED else None
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from openai import AsyncOpenAI
+
+from config import LLMClientConfig
+
+try:
+    import h2  # noqa: F401  httpx 需要 h2 才能启用 HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class LLMClientManager:
+    """
+    LLM 客户端管理器，utils.llm 和 utils.llm_sum 共用。
+    每个 endpoint（scheme://host:port）一个长连接池，连接和 TLS 会话在请求之间复用。
+    httpx 连接池绑定创建它的事件循环，在新的事件循环中使用时会重新创建。
+
+    用法：
+        async with manager:
+            ...
+    """
+
+    def __init__(self,
+                 max_connections: int = LLMClientConfig.MAX_CONNECTIONS,
+                 max_keepalive: int = LLMClientConfig.MAX_KEEPALIVE,
+                 keepalive_expiry: float = LLMClientConfig.KEEPALIVE_EXPIRY,
+                 http2: bool = LLMClientConfig.HTTP2,
+                 timeout: float = LLMClientConfig.TIMEOUT):
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        if http2 and not HTTP2_AVAILABLE:
+            logging.warning("h2 is not installed, LLM clients fall back to HTTP/1.1")
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.timeout = timeout
+        self._loop = None
+        self._http_clients: Dict[str, httpx.AsyncClient] = {}
+        self._openai_clients: Dict[Tuple[str, str], AsyncOpenAI] = {}
+
+    def _check_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # 旧事件循环上的连接无法再使用，也无法在新循环中关闭，直接丢弃
+            self._http_clients = {}
+            self._openai_clients = {}
+            self._loop = loop
+
+    def http_client(self, url: str) -> httpx.AsyncClient:
+        """返回 url 所在 endpoint 的共享 httpx 客户端。"""
+        self._check_loop()
+        parts = urlsplit(url)
+        endpoint = f"{parts.scheme}://{parts.netloc}"
+        if endpoint not in self._http_clients:
+            self._http_clients[endpoint] = httpx.AsyncClient(
+                limits=self.limits, http2=self.http2, timeout=self.timeout)
+        return self._http_clients[endpoint]
+
+    def openai_client(self, base_url: str, api_key: str) -> AsyncOpenAI:
+        """返回共享连接池的 AsyncOpenAI 客户端。"""
+        self._check_loop()
+        key = (base_url, api_key)
+        if key not in self._openai_clients:
+            self._openai_clients[key] = AsyncOpenAI(
+                api_key = api_key,
+                base_url = base_url,
+                http_client = self.http_client(base_url)
+                )
+        return self._openai_clients[key]
+
+    async def startup(self):
+        self._check_loop()
+
+    async def shutdown(self):
+        """关闭所有连接池，在事件循环结束前调用。"""
+        clients = list(self._http_clients.values())
+        self._http_clients = {}
+        self._openai_clients = {}
+        self._loop = None
+        for client in clients:
+            await client.aclose()
+
+    async def __aenter__(self):
+        await self.startup()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.shutdown()
+
+
+manager = LLMClientManager()
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+from config import LLMSchedulerConfig
+
+# 优先级，数值越小越优先。只在同一个调度器（同一进程）内有效
+PRIORITY_ALARM = 0  # 最近有报警的设备的实时帧
+PRIORITY_LIVE = 1  # 实时帧
+PRIORITIES = (PRIORITY_ALARM, PRIORITY_LIVE)
+
+
+class LLMScheduler:
+    """
+    LLM 请求调度器。
+    - 并发上限按 AIMD 自适应：请求延迟低于 latency_target 时每个 RTT 加 1，
+      超时或出错时乘以 backoff（每个 RTT 最多减一次）
+    - 等待的请求按优先级出队，同一优先级内按设备轮转，避免单个设备占满并发
+    并发上限和优先级都只在本进程内有效：main.py（utils.llm）和 main_sum.py（utils.llm_sum）
+    是不同的进程，各自有自己的调度器，总结进程的并发上限由 LLMSchedulerConfig.SUMMARY_MAX_LIMIT
+    单独限制，以免占用实时分析的模型容量。
+    """
+
+    def __init__(self,
+                 initial_limit: float = LLMSchedulerConfig.INITIAL_LIMIT,
+                 min_limit: float = LLMSchedulerConfig.MIN_LIMIT,
+                 max_limit: float = LLMSchedulerConfig.MAX_LIMIT,
+                 latency_target: float = LLMSchedulerConfig.LATENCY_TARGET,
+                 backoff: float = LLMSchedulerConfig.BACKOFF):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        # priority -> {device_id: deque[Future]}
+        self.queues = {p: OrderedDict() for p in PRIORITIES}
+
+    def _has_waiters(self) -> bool:
+        return any(self.queues[p] for p in PRIORITIES)
+
+    def _next_waiter(self):
+        for p in PRIORITIES:
+            devices = self.queues[p]
+            while devices:
+                device_id, waiters = next(iter(devices.items()))
+                future = waiters.popleft()
+                if waiters:
+                    # 轮转到队尾，下一次取其它设备
+                    devices.move_to_end(device_id)
+                else:
+                    del devices[device_id]
+                if not future.done():
+                    return future
+        return None
+
+    def _wake(self):
+        while self.in_flight < int(self.limit):
+            future = self._next_waiter()
+            if future is None:
+                break
+            self.in_flight += 1
+            future.set_result(None)
+
+    async def acquire(self, priority: int = PRIORITY_LIVE, device_id: str = ""):
+        if self.in_flight < int(self.limit) and not self._has_waiters():
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.queues[priority].setdefault(device_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已经分配到名额，但调用方被取消
+                self.release()
+            raise
+
+    def release(self, latency: float = None, error: bool = False):
+        """释放名额。latency 为 None 时（请求被取消）不调整并发上限。"""
+        self.in_flight -= 1
+        if latency is not None:
+            self._adjust(latency, error)
+        self._wake()
+
+    def _adjust(self, latency: float, error: bool):
+        now = time.monotonic()
+        if error or latency > self.latency_target:
+            if now - self.last_decrease >= latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.last_decrease = now
+                logging.info(f"LLM concurrency limit decreased to {self.limit:.2f} (latency {latency:.2f}s, error {error})")
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    async def run(self, func, *args, priority: int = PRIORITY_LIVE, device_id: str = "", **kwargs):
+        """在调度器控制下执行 await func(*args, **kwargs)。"""
+        await self.acquire(priority, device_id)
+        start = time.monotonic()
+        latency = None
+        error = False
+        try:
+            result = await func(*args, **kwargs)
+            latency = time.monotonic() - start
+            return result
+        except Exception:
+            latency = time.monotonic() - start
+            error = True
+            raise
+        finally:
+            self.release(latency, error)
+
+
+scheduler = LLMScheduler()
@@ -3,26 +3,34 @@ import asyncio
 from openai import OpenAI,AsyncOpenAI
 import json
 import time
-from config import SummaryLLMConfig
-import httpx
+from config import SummaryLLMConfig, LLMClientConfig
+from utils.llm_client import manager
+from config import LLMSchedulerConfig
+from utils.llm_scheduler import LLMScheduler
+
+# 总结在单独的进程中运行，不能与实时帧共用调度器，用较小的并发上限给实时分析留出模型容量
+scheduler = LLMScheduler(initial_limit=min(LLMSchedulerConfig.INITIAL_LIMIT, LLMSchedulerConfig.SUMMARY_MAX_LIMIT),
+                         max_limit=LLMSchedulerConfig.SUMMARY_MAX_LIMIT)
 
 
 
 is_fake = False
 
-async def call_api(messages: list) -> str:
+async def call_api(messages: list, device_id: str = "") -> str:
+    """经总结进程的调度器限流后调用模型，同一时间最多 SUMMARY_MAX_LIMIT 个请求。"""
+    return await scheduler.run(_request, messages, device_id=device_id)
+
+async def _request(messages: list) -> str:
     if is_fake:
-        async with httpx.AsyncClient() as client:
-            response = await client.get("http://localhost:8088/fakellm")
-            result_string = response.text
-            return result_string
+        client = manager.http_client(LLMClientConfig.FAKE_LLM_URL)
+        response = await client.get(LLMClientConfig.FAKE_LLM_URL)
+        response.raise_for_status()
+        result_string = response.text
+        return result_string
     
 
     else:
-        client = AsyncOpenAI(
-            api_key = SummaryLLMConfig.API_KEY,
-            base_url = SummaryLLMConfig.BASE_URL
-            )
+        client = manager.openai_client(SummaryLLMConfig.BASE_URL, SummaryLLMConfig.API_KEY)
         model_id = SummaryLLMConfig.MODEL_ID
         #print("Model id:", model_id)
         completion = await client.chat.completions.create(
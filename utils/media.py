@@ -9,19 +9,52 @@ from PIL import Image
 import numpy as np
 
 
+class EncodedFrame:
+    """
+    一帧图像的编码结果缓存。
+    缩放图、JPEG 字节和 base64 data URI 都按需生成并缓存，
+    同一帧的缩略图和 LLM 图片使用相同参数时只编码一次。
+    """
+    PREFIX = {".jpg": "data:image/jpeg;base64,", ".png": "data:image/png;base64,"}
+
+    def __init__(self, image_np: np.ndarray, ext='.jpg'):
+        self.image_np = image_np
+        self.ext = ext
+        self._resized = {}
+        self._encoded = {}
+        self._base64 = {}
+
+    def resized(self, scale=0.25) -> np.ndarray:
+        if scale == 1:
+            return self.image_np
+        if scale not in self._resized:
+            self._resized[scale] = cv2.resize(self.image_np, None, fx=scale, fy=scale)
+        return self._resized[scale]
+
+    def encoded(self, scale=0.25, quality=None) -> bytes:
+        """返回图片编码后的字节（默认 JPEG），quality 为 None 时使用 OpenCV 默认质量。"""
+        key = (scale, quality)
+        if key not in self._encoded:
+            params = []
+            if quality is not None:
+                params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+            # 将ndarray编码成指定格式的图片内存缓冲区
+            success, encoded_image = cv2.imencode(self.ext, self.resized(scale), params)
+            if not success:
+                raise ValueError("图像编码失败")
+            self._encoded[key] = encoded_image.tobytes()
+        return self._encoded[key]
+
+    def base64(self, scale=0.25, quality=None) -> str:
+        key = (scale, quality)
+        if key not in self._base64:
+            base64_bytes = base64.b64encode(self.encoded(scale, quality))
+            self._base64[key] = self.PREFIX.get(self.ext, self.PREFIX[".jpg"]) + base64_bytes.decode('utf-8')
+        return self._base64[key]
+
+
 def ndarray_to_base64(image_np: np.ndarray, ext='.jpg', scale=0.25) -> str:
-    prefix = "data:image/jpeg;base64,"
-    if scale != 1:
-        image_np = cv2.resize(image_np, None, fx=scale, fy=scale)
-    # 将ndarray编码成指定格式的图片内存缓冲区
-    success, encoded_image = cv2.imencode(ext, image_np)
-    if not success:
-        raise ValueError("图像编码失败")
-    # 转换为bytes并进行base64编码
-    base64_bytes = base64.b64encode(encoded_image.tobytes())
-    # 转换为字符串返回
-    base64_str = prefix + base64_bytes.decode('utf-8')
-    return base64_str
+    return EncodedFrame(image_np, ext).base64(scale)
 
 def _encode_image(img: Image):
     """Encode image as base64"""
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional,Literal, Union
+from typing import Optional,Literal, Union, List
 import datetime
 
 
@@ -33,7 +33,8 @@ class FrameInfo(BaseModel):
     object_name: str
     ssim: float
 
-    thumbnail: Optional[str] = None
+    thumbnail: Optional[str] = None # base64 data URI，用于通知
+    thumbnail_hash: Optional[str] = None # 缩略图在 BlobStore 中的哈希，用于存储
 
     # llm output
     llm_output: Optional[LLMOutput] = None
@@ -58,8 +59,26 @@ class MessagePayload(BaseModel):
     description: str
     event_catagory: str
     triger_alarm: float
+    seq: Optional[int] = None # 通知服务分配的序号，单调递增
+    thumbnail_hash: Optional[str] = None # 缩略图在 blob_store 中的哈希，客户端按它缓存解码后的图片
     
 
+class Subscription(BaseModel):
+    """/ws/notify 客户端的订阅条件，客户端连接后发送 JSON，可随时重新发送以修改。"""
+    devices: Optional[List[str]] = None # 订阅的设备，None 表示所有设备
+    types: Optional[List[Literal['event','summary','alarm']]] = None # 订阅的消息类型，None 表示所有类型
+    min_alarm: float = 0 # 只接收 triger_alarm 不小于该值的事件和报警（不影响 summary）
+    thumbnail: bool = True # 是否需要缩略图
+    last_seq: Optional[int] = None # 重连时填写收到的最后一条消息的序号，服务端先补发之后的消息
+
+    def accepts(self, payload: MessagePayload) -> bool:
+        """按类型和报警级别判断，设备由订阅索引筛选。"""
+        if self.types is not None and payload.type not in self.types:
+            return False
+        if payload.type != 'summary' and payload.triger_alarm < self.min_alarm:
+            return False
+        return True
+
 def timestamp_to_str(timestamp:int,style="full"):
     timestamp = timestamp / 1000
     if style=="full":
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from collections import deque
+from typing import List
+
+from config import NotifyConfig
+from utils.llm_client import manager
+from utils.models import MessagePayload
+
+
+class NotificationPublisher:
+    """
+    异步发送事件通知。publish 只把通知放入队列，不等待网络，帧分析不会被通知发送阻塞。
+    后台任务把队列中的通知按条数（batch_size）或时间（batch_window）合并为一个请求，
+    通过共享连接池发送到 api.py 的批量接口，失败时按指数退避重试。
+    队列有上限，满时按 overflow 处理：
+      - coalesce：替换队列中同一设备、同一类型的旧通知，没有则按 drop_oldest 处理
+      - drop_oldest：丢弃最旧的普通通知
+      - drop_new：丢弃新通知
+    丢弃时报警级别的通知（type 为 alarm 或 triger_alarm 不低于 alarm_threshold）优先保留：
+    不会被普通通知替换，只有队列中全是报警时才丢弃最旧的报警，此时新来的普通通知直接丢弃。
+
+    用法：
+        async with publisher:
+            publisher.publish(payload)
+    """
+
+    def __init__(self, url: str = NotifyConfig.URL,
+                 batch_size: int = NotifyConfig.BATCH_SIZE,
+                 batch_window: float = NotifyConfig.BATCH_WINDOW,
+                 queue_size: int = NotifyConfig.QUEUE_SIZE,
+                 overflow: str = NotifyConfig.OVERFLOW,
+                 alarm_threshold: float = NotifyConfig.ALARM_THRESHOLD,
+                 max_retries: int = NotifyConfig.MAX_RETRIES,
+                 retry_backoff: float = NotifyConfig.RETRY_BACKOFF,
+                 max_backoff: float = NotifyConfig.MAX_BACKOFF):
+        if overflow not in ("coalesce", "drop_oldest", "drop_new"):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.url = url
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.alarm_threshold = alarm_threshold
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.queue = deque()
+        self.dropped = 0
+        self.sending = 0  # 已从队列取出、正在发送的通知数
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+
+    def _check_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # 绑定到当前事件循环，旧循环中未发送的通知无法再发送
+            self.queue.clear()
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    def publish(self, payload: MessagePayload) -> bool:
+        """加入发送队列，不等待发送。返回 False 表示通知被丢弃。"""
+        self._check_loop()
+        if len(self.queue) >= self.queue_size and not self._make_room(payload):
+            self.dropped += 1
+            logging.warning(f"Notification queue full, dropped {payload.type} from {payload.device_id}")
+            return False
+        self.queue.append(payload)
+        self._wakeup.set()
+        return True
+
+    def _is_alarm(self, payload: MessagePayload) -> bool:
+        return payload.type == "alarm" or payload.triger_alarm >= self.alarm_threshold
+
+    def _make_room(self, payload: MessagePayload) -> bool:
+        if self.overflow == "drop_new":
+            return False
+        is_alarm = self._is_alarm(payload)
+        if self.overflow == "coalesce":
+            for i in range(len(self.queue) - 1, -1, -1):
+                queued = self.queue[i]
+                if queued.device_id == payload.device_id and queued.type == payload.type \
+                        and (is_alarm or not self._is_alarm(queued)):
+                    del self.queue[i]
+                    self.dropped += 1
+                    return True
+        # 先丢弃最旧的普通通知
+        for i, queued in enumerate(self.queue):
+            if not self._is_alarm(queued):
+                del self.queue[i]
+                self.dropped += 1
+                return True
+        # 队列中全是报警：新通知也是报警时丢弃最旧的报警，否则丢弃新通知
+        if not is_alarm:
+            return False
+        self.queue.popleft()
+        self.dropped += 1
+        return True
+
+    async def _run(self):
+        while True:
+            if not self.queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            if len(self.queue) < self.batch_size:
+                # 等一小段时间凑批
+                await asyncio.sleep(self.batch_window)
+            batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+            if batch:
+                self.sending = len(batch)
+                try:
+                    await self._send(batch)
+                finally:
+                    self.sending = 0
+
+    async def _send(self, batch: List[MessagePayload]):
+        body = [payload.model_dump() for payload in batch]
+        delay = self.retry_backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                client = manager.http_client(self.url)
+                response = await client.post(self.url, json=body)
+                response.raise_for_status()
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logging.error(f"Failed to send {len(batch)} notifications to {self.url}: {e}")
+                    return
+                logging.warning(f"Sending notifications failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    async def flush(self, timeout: float = 5.0):
+        """等待队列中的通知发送完，最多等待 timeout 秒。"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self.queue or self.sending) and self._task is not None and not self._task.done() and loop.time() < deadline:
+            await asyncio.sleep(self.batch_window)
+
+    async def close(self):
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+publisher = NotificationPublisher()
@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import FetchConfig
+from utils.models import VideoInfo
+
+
+def segment_url(video_info: VideoInfo, base_url: Optional[str] = FetchConfig.OBJECT_STORAGE_URL) -> str:
+    """视频片段的 PAR 地址。base_url 为空时使用 OCI 对象存储。"""
+    domian = base_url.rstrip('/') if base_url else f"https://objectstorage.{video_info.region}.oraclecloud.com"
+    par = f"p/{video_info.par}"
+    namespace = f"n/{video_info.namespace}"
+    bucket = f"b/{video_info.bucket}"
+    object_name = f"o/{video_info.object_name}"
+    return f"{domian}/{par}/{namespace}/{bucket}/{object_name}"
+
+
+class SegmentCache:
+    """
+    本地片段缓存，按 LRU 删除。
+    每个进程使用 root 下单独的临时目录，退出时删除。正在使用的片段（pin）不会被删除。
+    """
+
+    def __init__(self, root: str = FetchConfig.CACHE_PATH, max_bytes: int = FetchConfig.CACHE_MAX_BYTES):
+        os.makedirs(root, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=root)
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()  # key -> 文件大小
+        self.pins: Dict[str, int] = {}
+        self.size = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[str]:
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.path(key)
+
+    def add(self, key: str, size: int):
+        self.entries[key] = size
+        self.size += size
+        self.evict()
+
+    def pin(self, key: str):
+        self.pins[key] = self.pins.get(key, 0) + 1
+
+    def unpin(self, key: str):
+        self.pins[key] -= 1
+        if self.pins[key] == 0:
+            del self.pins[key]
+        self.evict()
+
+    def evict(self):
+        for key in list(self.entries):
+            if self.size <= self.max_bytes:
+                break
+            if key in self.pins:
+                continue
+            self.size -= self.entries.pop(key)
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.entries.clear()
+        self.size = 0
+
+
+class SegmentFetcher:
+    """
+    把视频片段下载到 SegmentCache，解码时读取本地文件，网络延迟不再阻塞解码。
+    - 最多 max_downloads 个片段同时下载，其余按请求顺序排队
+    - 片段大于 part_size 时按 Range 分块，每个片段最多 range_parts 个请求并行；
+      服务器不支持 Range（返回 200），或返回 206 但没有 Content-Range 时退化为一次完整下载
+    - 同一地址同时只下载一次；fetch 返回的文件在 release 之前不会被删除
+    - 使用自己的 httpx 连接池（不占用 LLM 请求的连接），文件写入在线程池中执行，不阻塞事件循环
+
+    用法：
+        path = await fetcher.fetch(url)
+        try:
+            ...
+        finally:
+            fetcher.release(url)
+        ...
+        await fetcher.close()
+    """
+
+    def __init__(self, cache: Optional[SegmentCache] = None,
+                 max_downloads: int = FetchConfig.MAX_DOWNLOADS,
+                 part_size: int = FetchConfig.PART_SIZE,
+                 range_parts: int = FetchConfig.RANGE_PARTS,
+                 timeout: float = FetchConfig.TIMEOUT):
+        self.cache = cache if cache is not None else SegmentCache()
+        self.max_downloads = max_downloads
+        self.part_size = part_size
+        self.range_parts = range_parts
+        self.timeout = timeout
+        self.downloads: Dict[str, asyncio.Task] = {}
+        self._semaphore = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """第一次下载时在事件循环中创建，每个片段的每个分块请求最多各占一个连接。"""
+        if self._client is None:
+            connections = self.max_downloads * self.range_parts
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+                timeout=self.timeout)
+        return self._client
+
+    @staticmethod
+    def key(url: str) -> str:
+        ext = os.path.splitext(urlsplit(url).path)[1]
+        return hashlib.sha1(url.encode('utf-8')).hexdigest() + ext
+
+    async def fetch(self, url: str) -> str:
+        """返回片段的本地路径，需要时下载。调用方用完后调用 release。"""
+        key = self.key(url)
+        # 先 pin，等待下载期间不会被其它片段挤出缓存
+        self.cache.pin(key)
+        try:
+            path = self.cache.get(key)
+            if path is None:
+                if key not in self.downloads:
+                    task = asyncio.create_task(self._download(url, key))
+                    self.downloads[key] = task
+                    task.add_done_callback(lambda _: self.downloads.pop(key, None))
+                path = await asyncio.shield(self.downloads[key])
+            return path
+        except BaseException:
+            self.cache.unpin(key)
+            raise
+
+    def release(self, url: str):
+        self.cache.unpin(self.key(url))
+
+    async def _download(self, url: str, key: str) -> str:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_downloads)
+        path = self.cache.path(key)
+        tmp_path = path + ".part"
+        async with self._semaphore:
+            client = self.client
+            try:
+                with open(tmp_path, "wb") as f:
+                    writer = _FileWriter(f)
+                    try:
+                        # 第一个请求同时取得文件大小
+                        headers = {"Range": f"bytes=0-{self.part_size - 1}"}
+                        async with client.stream("GET", url, headers=headers) as response:
+                            response.raise_for_status()
+                            total = self._total_size(response)
+                            ranged = response.status_code == 206 and total > 0
+                            if ranged or response.status_code != 206:
+                                await writer.stream(response)
+                        if not ranged and response.status_code == 206:
+                            # 206 但没有 Content-Range，无法确定文件大小，重新完整下载
+                            logging.debug(f"No Content-Range from {url}, downloading it in one request")
+                            async with client.stream("GET", url) as response:
+                                response.raise_for_status()
+                                await writer.stream(response)
+                        elif ranged and total > self.part_size:
+                            await self._download_ranges(client, url, writer, total)
+                    finally:
+                        # 出错或被取消时也等线程池中的写入结束，再关闭文件
+                        await writer.wait()
+                    size = total if ranged else writer.end
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        self.cache.add(key, size)
+        logging.debug(f"Fetched {url} ({size} bytes)")
+        return path
+
+    async def _download_ranges(self, client, url: str, writer: "_FileWriter", total: int):
+        limit = asyncio.Semaphore(self.range_parts)
+
+        async def fetch_range(start: int):
+            end = min(start + self.part_size, total) - 1
+            async with limit:
+                response = await client.get(url, headers={"Range": f"bytes={start}-{end}"})
+                response.raise_for_status()
+                if response.status_code != 206 or len(response.content) != end - start + 1:
+                    raise IOError(f"Unexpected range response for {url}: {response.status_code}")
+            await writer.write(response.content, start)
+
+        tasks = [asyncio.create_task(fetch_range(start)) for start in range(self.part_size, total, self.part_size)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # 一个分块失败时取消其余分块，避免在文件关闭后继续写入
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    @staticmethod
+    def _total_size(response) -> int:
+        match = re.match(r"bytes \d+-\d+/(\d+)", response.headers.get("content-range", ""))
+        return int(match.group(1)) if match else 0
+
+    async def close(self):
+        for task in self.downloads.values():
+            task.cancel()
+        if self.downloads:
+            await asyncio.gather(*self.downloads.values(), return_exceptions=True)
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+        self.cache.close()
+
+
+class _FileWriter:
+    """在线程池中写入下载文件，各分块按偏移写入，互不交错。"""
+
+    def __init__(self, f):
+        self.f = f
+        self.end = 0  # 顺序写入（stream）的结束位置
+        self.lock = threading.Lock()
+        self.pending = set()
+
+    def _write_at(self, data: bytes, offset: int):
+        with self.lock:
+            self.f.seek(offset)
+            self.f.write(data)
+
+    async def write(self, data: bytes, offset: int):
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, self._write_at, data, offset)
+        # 写入完成前一直留在 pending 中，调用方被取消时 wait 仍会等它写完
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        await asyncio.shield(future)
+
+    async def stream(self, response):
+        """从文件开头顺序写入响应内容。"""
+        self.end = 0
+        async for chunk in response.aiter_bytes():
+            await self.write(chunk, self.end)
+            self.end += len(chunk)
+
+    async def wait(self):
+        if self.pending:
+            await asyncio.gather(*self.pending, return_exceptions=True)
@@ -4,19 +4,24 @@ import json
 from datetime import datetime 
 from concurrent.futures import ThreadPoolExecutor 
 
-from collections import deque 
+from collections import deque, OrderedDict
 from typing import Optional, Dict, Any , List,Set
 import numpy as np 
 import logging 
 # from multi_modal_analyzer import MultiModalAnalyzer
 import time
+import threading
 import uvicorn 
-import requests
 from multiprocessing import set_start_method 
-from config import VideoConfig, ServerConfig, LOG_CONFIG
+from config import VideoConfig, LLMConfig, ServerConfig, DBConfig, KVConfig, LOG_CONFIG
 
 
-from utils import media, llm
+from utils import media, llm, database
+from utils.change_detection import create_detector, phash
+from utils.llm_cache import cache as llm_cache, prompt_version
+from utils.blobstore import blob_store
+from utils.segment_fetcher import segment_url
+from utils.notifier import publisher
 from utils.models import (
     VideoInfo, 
     LLMOutput, 
@@ -26,9 +31,9 @@ from utils.models import (
     MessagePayload
     )
 
-from fakeredis.localredis import LocalRedis
+from fakeredis.resp import connect_store
 
-kv_store = LocalRedis()
+kv_store = connect_store(KVConfig.URL)
 
 
 
@@ -43,31 +48,70 @@ logging.basicConfig(
 
 
 
+class DeviceSession:
+    """
+    同一设备连续片段之间保留的关键帧检测状态：上一关键帧的特征和检测器（含工作缓冲区）。
+    新片段的第一帧与上一片段最后一个关键帧比较，画面没有变化时不再作为关键帧送给 LLM。
+    同一设备的片段由 IngestionEngine 按顺序处理，会话不会被并发使用。
+    """
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.detector = create_detector()
+        self.prev_feature = None
+        self.last_timestamp = None  # 最近一个抽样帧的时间(毫秒)
+
+    def start_segment(self, timestamp, max_gap=VideoConfig.SESSION_MAX_GAP):
+        """片段开始时调用。与上一片段间隔过久（例如设备离线）时画面可能已完全不同，重新开始。"""
+        if self.last_timestamp is not None and timestamp - self.last_timestamp > max_gap * 1000:
+            self.prev_feature = None
+
+
+sessions: "OrderedDict[str, DeviceSession]" = OrderedDict()
+_sessions_lock = threading.Lock()
+
+def get_session(device_id) -> DeviceSession:
+    """按设备共享 DeviceSession，最多保留 MAX_SESSIONS 个设备。VideoProcessor 在线程池中创建，需要加锁。"""
+    with _sessions_lock:
+        session = sessions.pop(device_id, None) or DeviceSession(device_id)
+        sessions[device_id] = session
+        while len(sessions) > VideoConfig.MAX_SESSIONS:
+            sessions.popitem(last=False)
+        return session
+
+
 # 视频流处理器 
 class VideoProcessor:
-    def __init__(self, video_info):
+    def __init__(self, video_info, executor=None, video_source=None):
         self.video_info = video_info
+        self.executor = executor  # 解码线程池，None 时使用事件循环默认线程池
         self.device_id = video_info.device_id
         self.timestamp = video_info.timestamp
 
-        self.video_source = self.get_url()
+        # video_source 为预先下载的本地文件，为空时直接从对象存储读取
+        self.video_source = video_source or self.get_url()
         self.cap = self.open_video()
 
         self.get_video_info()
         # self.frame_buffer = deque(maxlen=3)
         # self.message_buffer = deque(maxlen=3)
 
-        self.prev_frame = None
+        # 关键帧检测状态在同一设备的片段之间延续
+        self.session = get_session(self.device_id)
+        self.session.start_segment(self.timestamp)
+        self.pending_analysis = set()
         self.data_processor = DataProcessor()
 
+    @property
+    def batcher(self) -> llm.FrameBatcher:
+        """
+        每次使用时在事件循环中查找：__init__ 在线程池中执行，而空闲的 FrameBatcher 在事件循环中被移除，
+        不在线程中读写 llm.batchers，也不会继续使用已被移除的 FrameBatcher。
+        """
+        return llm.get_batcher(self.device_id)
+
     def get_url(self):
-        domian = f"https://objectstorage.{self.video_info.region}.oraclecloud.com"
-        par = f"p/{self.video_info.par}"
-        namespace = f"n/{self.video_info.namespace}"
-        bucket = f"b/{self.video_info.bucket}"
-        object_name = f"o/{self.video_info.object_name}"
-        url = f"{domian}/{par}/{namespace}/{bucket}/{object_name}"
-        return url
+        return segment_url(self.video_info)
     
     def open_video(self):
         cap = cv2.VideoCapture(self.video_source)
@@ -92,124 +136,233 @@ class VideoProcessor:
         self.height = self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
 
 
-    async def extract_frames(self):
-        """Extract frames from video with device ID and timestamp in frame names"""
+    def get_frame_step(self):
+        """抽帧间隔(帧)。FRAME_INTERVAL_SEC 大于0时按视频帧率换算。"""
+        if VideoConfig.FRAME_INTERVAL_SEC > 0:
+            step = int(round(VideoConfig.FRAME_INTERVAL_SEC * self.fps))
+        else:
+            step = int(VideoConfig.FRAME_INTERVAL)
+        return max(step, 1)
+
+    def iter_sampled_frames(self):
+        """
+        只解码需要分析的帧。
+        跳过的帧只 grab() 不 retrieve()，省去解码后的颜色转换和拷贝；
+        抽帧间隔较大时直接 seek 到目标帧，由 FFmpeg 从最近的关键帧开始解码。
+        """
+        step = self.get_frame_step()
+        use_seek = step >= VideoConfig.SEEK_MIN_INTERVAL
         frame_count = 0
-        keyframe_count = 0
-        is_keyframe = True
-        while self.cap.isOpened():
-            #try:
-            ret, frame = self.cap.read()
-            if not ret:
+        while self.cap.isOpened() and frame_count < self.total_frames:
+            if frame_count % step == 0:
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                yield frame_count, frame
+                frame_count += 1
+            elif use_seek:
+                target = (frame_count // step + 1) * step
+                if target >= self.total_frames:
+                    break
+                if self.cap.set(cv2.CAP_PROP_POS_FRAMES, target):
+                    frame_count = target
+                else:
+                    # seek 失败时解码位置没有变化，frame_count 保持不变，之后逐帧 grab() 到目标帧
+                    logging.warning(f"Seek failed on {self.video_source}, fallback to grab()")
+                    use_seek = False
+            else:
+                if not self.cap.grab():
+                    break
+                frame_count += 1
+
+    def decode_next(self, frames):
+        """在线程池中解码下一帧，并统一为 uint8 BGR。"""
+        item = next(frames, None)
+        if item is None:
+            return None
+        frame_count, frame = item
+        # 转换颜色空间并缓冲 
+        if frame.dtype != np.uint8:
+            frame = frame.astype(np.uint8)
+        if len(frame.shape) == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        return frame_count, frame
+
+    async def extract_frames(self):
+        """
+        Extract frames from video with device ID and timestamp in frame names.
+        流水线：解码 -> 关键帧过滤 -> LLM 分析 -> 保存/通知，各阶段之间用有界队列连接，
+        下一帧的解码和上一帧的 LLM 调用并行执行。
+        """
+        decoded = asyncio.Queue(maxsize=VideoConfig.QUEUE_SIZE)
+        keyframes = asyncio.Queue(maxsize=VideoConfig.QUEUE_SIZE)
+        analyzed = asyncio.Queue(maxsize=VideoConfig.QUEUE_SIZE)
+        self.keyframe_count = 0
+        try:
+            await run_stages(
+                self.decode_stage(decoded),
+                self.filter_stage(decoded, keyframes),
+                self.analyze_stage(keyframes, analyzed),
+                self.persist_stage(analyzed),
+                )
+        finally:
+            for future in list(self.pending_analysis):
+                future.cancel()
+            self.cap.release()
+        logging.info(f"Extracted {self.keyframe_count} / {self.total_frames} frames from {self.video_info.object_name}")
+
+    async def decode_stage(self, output: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        frames = self.iter_sampled_frames()
+        while True:
+            # 解码在线程池中执行，等待期间其它片段的 LLM 调用可以继续
+            item = await loop.run_in_executor(self.executor, self.decode_next, frames)
+            await output.put(item)
+            if item is None:
                 break
 
-            # Only save frames at specified intervals
-            if frame_count % VideoConfig.FRAME_INTERVAL == 0:
-                # Calculate timestamp for current frame (in milliseconds)
-                frame_time_ms = int((frame_count / self.fps) * 1000)
-                frame_timestamp = self.timestamp + frame_time_ms
-                
-                # 转换颜色空间并缓冲 
-                if frame.dtype != np.uint8:
-                    frame = frame.astype(np.uint8)
-                if len(frame.shape) == 2:
-                    frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
-
-                if self.prev_frame is None:
-                    is_keyframe = True
-                    ssim = 0
-                else:
-                    ssim = media._similarity_score(self.prev_frame, frame)
-                    # print("ssim:", ssim)
-                    if ssim < VideoConfig.SIMILARITY_THRESHOLD:
-                        is_keyframe = True
-                    else:
-                        is_keyframe = False
-
-                if is_keyframe:
-                    frame_info = FrameInfo(
-                        device_id = self.video_info.device_id, 
-                        timestamp = frame_timestamp,
-                        object_name = self.video_info.object_name,
-                        ssim = ssim
-                        )
-
-                    # self.process_keyframe(frame,frame_info)
-                    # asyncio.run(self.process_keyframe(frame,frame_info))
-                    await self.process_keyframe(frame,frame_info)
-
-                    self.prev_frame = frame
-                    keyframe_count += 1
-            
-            frame_count += 1                
+    async def filter_stage(self, input: asyncio.Queue, output: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await input.get()
+            if item is None:
+                await output.put(None)
+                break
+            frame_count, frame = item
+            # Calculate timestamp for current frame (in milliseconds)
+            frame_time_ms = int((frame_count / self.fps) * 1000)
+            frame_timestamp = self.timestamp + frame_time_ms
+
+            session = self.session
+            ssim, feature = await loop.run_in_executor(
+                self.executor, session.detector.compare, session.prev_feature, frame)
+            # print("ssim:", ssim)
+            is_keyframe = session.prev_feature is None or ssim < VideoConfig.SIMILARITY_THRESHOLDS[VideoConfig.CHANGE_METRIC]
+            session.last_timestamp = frame_timestamp
+
+            if is_keyframe:
+                frame_info = FrameInfo(
+                    device_id = self.video_info.device_id, 
+                    timestamp = frame_timestamp,
+                    object_name = self.video_info.object_name,
+                    ssim = ssim
+                    )
+                session.prev_feature = feature
+                self.keyframe_count += 1
+                await output.put((frame, frame_info))
+
+    async def analyze_stage(self, input: asyncio.Queue, output: asyncio.Queue):
+        """
+        提交关键帧后不等待结果，使多个关键帧可以合并为一个 LLM 请求；
+        结果的 future 按顺序交给下一阶段。
+        """
+        while True:
+            item = await input.get()
+            if item is None:
+                # 片段结束，不再等待凑满一批
+                self.batcher.flush()
+                await output.put(None)
+                break
+            frame, frame_info = item
+            # 缩略图和 LLM 图片共用同一份编码缓存
+            future = await self.process_keyframe(media.EncodedFrame(frame), frame_info)
+            self.pending_analysis.add(future)
+            future.add_done_callback(self.pending_analysis.discard)
+            await output.put((frame_info, future))
+
+    async def persist_stage(self, input: asyncio.Queue):
+        while True:
+            item = await input.get()
+            if item is None:
+                break
+            frame_info, future = item
+            json_result = await future
+            logging.debug(f"LLM result for {frame_info.object_name} @ {frame_info.timestamp}: {json_result}")
+            #try:
+            llm_output = LLMOutput(
+                description=json_result["description"],
+                event_catagory=json_result["event_category"],
+                triger_alarm=json_result["trigger_alarm"],
+                # is_new_event=json_result["is_new_event"]
+                )
+            frame_info.llm_output = llm_output
             # except Exception as e:
-            #     logging.error(f"Error processing frame {frame_count} from {self.video_info.object_name}: {str(e)}")
-            #     break
-
-        self.cap.release()
-        logging.info(f"Extracted {keyframe_count} / {self.total_frames} frames from {self.video_info.object_name}")
-
-    async def process_keyframe(self,frame,frame_info):
-        thumbnail = media.ndarray_to_base64(image_np = frame, 
-                                            scale=VideoConfig.SCALE)
-        frame_info.thumbnail = thumbnail
-        string_result = await self.llm_analysis(frame,frame_info)
-        #try:
-        json_result = llm.convert_to_json(string_result)
-        llm_output = LLMOutput(
-            description=json_result["description"],
-            event_catagory=json_result["event_category"],
-            triger_alarm=json_result["trigger_alarm"],
-            # is_new_event=json_result["is_new_event"]
-            )
-        frame_info.llm_output = llm_output
-        self.data_processor.save_frameinfo(frame_info)
+            #     logging.error(f"Error converting string to JSON: {str(e)}")
+            #     json_result = None
+            await self.persist_keyframe(frame_info, json_result)
+
+    async def process_keyframe(self,frame:media.EncodedFrame,frame_info):
+        """
+        生成缩略图和 LLM 图片并提交分析，返回分析结果的 future。
+        画面与缓存中的帧相同（感知哈希相近）时直接复用缓存结果，不调用模型。
+        """
+        loop = asyncio.get_running_loop()
+        frame_info.thumbnail, frame_info.thumbnail_hash = await loop.run_in_executor(
+            self.executor, self.encode_thumbnail, frame)
+        previous_events = ""
+        if llm_cache is not None:
+            frame_hash = await loop.run_in_executor(self.executor, phash, frame.image_np)
+            version = prompt_version(previous_events)
+            json_result = llm_cache.get(frame_hash, version)
+            if json_result is not None:
+                logging.info(f"LLM cache hit for {frame_info.object_name} @ {frame_info.timestamp}")
+                future = loop.create_future()
+                future.set_result(json_result)
+                return future
+        image_data = await loop.run_in_executor(self.executor, frame.base64, LLMConfig.IMAGE_SCALE)
+        future = self.llm_analysis(image_data,frame_info,previous_events)
+        if llm_cache is not None:
+            def save_result(f):
+                if not f.cancelled() and f.exception() is None:
+                    llm_cache.put(frame_hash, version, f.result())
+            future.add_done_callback(save_result)
+        return future
+
+    def encode_thumbnail(self,frame:media.EncodedFrame):
+        """返回缩略图的 data URI，并把 JPEG 写入 BlobStore，返回其哈希。"""
+        thumbnail = frame.base64(VideoConfig.SCALE)
+        thumbnail_hash = blob_store.put(frame.encoded(VideoConfig.SCALE))
+        return thumbnail, thumbnail_hash
+
+    async def persist_keyframe(self,frame_info,json_result):
+        committed = await self.data_processor.save_frameinfo(frame_info)
         # self.message_buffer.append(frame_info)
 
-        # 保存事件类型
-        self.save_event_time(frame_info,json_result)
+        # 等这一帧提交后再推进事件时间窗口，否则按窗口查询的摘要可能读不到这一帧
+        try:
+            await committed
+        except Exception as e:
+            logging.error(f"Failed to save frame {frame_info.object_name} @ {frame_info.timestamp}: {e}")
+            return
 
-        # 发送消息        
-        self.send_message(frame_info)
-            
-
-        # except Exception as e:
-        #     logging.error(f"Error converting string to JSON: {str(e)}")
-        #     print(string_result)
-        #     json_result = None
+        # 保存事件类型。KV 读写会阻塞（文件锁或同步 socket），放到线程池执行
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.save_event_time, frame_info, json_result)
 
+        # 发送消息（只放入发送队列，不等待）
+        self.send_message(frame_info)
 
-    async def llm_analysis(self,frame,frame_info):
-        images_data = [media.ndarray_to_base64(frame)]
-        previous_events = ""
+    def llm_analysis(self,image_data,frame_info,previous_events=""):
         # for each in self.message_buffer:
         #     previous_events += f"""{timestamp_to_str(each.timestamp)}: {each.llm_output.event_catagory} {each.llm_output.description}\n"""
         
         # previous_events += f"\nCurrent time: {timestamp_to_str(frame_info.timestamp)}\n"
-        string_result = await llm.video_analyzer(images_data,previous_events)
-        print(string_result)
-        return string_result
+        return self.batcher.submit(image_data,previous_events)
     
     def save_event_time(self,frame_info,json_result):
-        device_data = kv_store.get(frame_info.device_id)
-        if device_data is None:
-            device_data = {
-                json_result["event_category"]:
-                {
+        """按设备和事件类型记录事件时间窗口，只读写该事件类型一个字段。"""
+        event_category = json_result["event_category"]
+        def update(event_time):
+            if event_time is None:
+                return {
                     "min_time" : frame_info.timestamp,
                     "max_time" : frame_info.timestamp
                     }
-            }
-        else:
-            if json_result["event_category"] in device_data:
-                device_data[json_result["event_category"]]["max_time"] = frame_info.timestamp
-            else:
-                device_data[json_result["event_category"]] = {
-                    "min_time" : frame_info.timestamp,
-                    "max_time" : frame_info.timestamp
-                    }
-        print(device_data)
-        kv_store.set(frame_info.device_id,device_data)
+            event_time["max_time"] = frame_info.timestamp
+            return event_time
+        # 跨进程原子地读改写（LocalRedis 文件锁，或服务端 WATCH/MULTI/EXEC）
+        event_time = kv_store.hupdate(frame_info.device_id,event_category,update)
+        logging.debug(f"Event window of {frame_info.device_id}/{event_category}: {event_time}")
 
     def send_message(self, frame_info: FrameInfo):
         notify_message = MessagePayload(
@@ -217,55 +370,50 @@ class VideoProcessor:
             device_id = frame_info.device_id,
             timestamp = frame_info.timestamp,
             thumbnail = frame_info.thumbnail,
+            thumbnail_hash = frame_info.thumbnail_hash,
             description = frame_info.llm_output.description,
             event_catagory = frame_info.llm_output.event_catagory,
             triger_alarm = frame_info.llm_output.triger_alarm
         )
-
-        SEND_URL = "http://127.0.0.1:16532/sendjson"
-        res = requests.post(SEND_URL, json=notify_message.model_dump())
-        return
-        
-
+        publisher.publish(notify_message)
+
+
+async def run_stages(*stages):
+    """并发运行流水线各阶段，任一阶段出错时取消其余阶段，避免它们阻塞在队列上。"""
+    tasks = [asyncio.create_task(stage) for stage in stages]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for task in done:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
         
 
 
 
-import sqlite3
-
 class DataProcessor:
     def __init__(self):
-        self.conn = sqlite3.connect('data.db')
-        self.cur  = self.conn.cursor()
-        self.init_table()
-
-    def init_table(self):
-        self.cur.execute('''
-            CREATE TABLE IF NOT EXISTS video_info (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                device_id TEXT,
-                timestamp INTEGER,
-                object_name TEXT,
-                ssim REAL,
-                thumbnail TEXT,
-                description TEXT,
-                event_catagory TEXT,
-                triger_alarm REAL,
-                is_new_event BOOLEAN
-            )
-        ''')
-        self.conn.commit()
-
-    def save_frameinfo(self,frame_info:FrameInfo):
+        # 所有片段共用一个写线程，写入按批提交，不阻塞帧处理流水线
+        # 写线程启动时执行数据库迁移（建表、建索引）
+        self.writer = database.get_writer(DBConfig.PATH)
+
+    async def save_frameinfo(self,frame_info:FrameInfo):
+        """
+        thumbnail 列只保存缩略图哈希，图片通过 blob_store.load 读取。
+        返回写入提交后完成的 future。
+        """
         llm_output = frame_info.llm_output
-        self.cur.execute('''
+        return await self.writer.enqueue('''
             INSERT INTO video_info (device_id, timestamp, object_name, ssim, thumbnail,
                          description, event_catagory, triger_alarm)
             VALUES (?, ?, ?,?, ?, ?, ?, ?)''', 
-        (frame_info.device_id,frame_info.timestamp,frame_info.object_name,frame_info.ssim,frame_info.thumbnail,
+        (frame_info.device_id,frame_info.timestamp,frame_info.object_name,frame_info.ssim,frame_info.thumbnail_hash,
          llm_output.description,llm_output.event_catagory,llm_output.triger_alarm)
         )
-        self.conn.commit()
         logging.info(f"Saved frame info: {llm_output.description}")
 
 
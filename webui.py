@@ -1,19 +1,28 @@
 import streamlit as st
 import threading
-import time
 import websocket
-import queue
-from streamlit.runtime.scriptrunner import add_script_run_ctx
 import pandas as pd
 import json
-import base64, io
+import os
+import hashlib
+from collections import OrderedDict, deque
 from datetime import datetime, timezone
+from config import DBConfig, WebUIConfig
+from utils import database
+from utils.blobstore import blob_store
 from utils.models import (
     timestamp_to_str
     )
 
 
-WEBSOCKET_URL = "ws://localhost:16532/ws/notify"
+WEBSOCKET_URL = WebUIConfig.WEBSOCKET_URL
+# 订阅条件，由服务端过滤。devices/types 为 None 表示全部
+SUBSCRIPTION = {
+    "devices": None,
+    "types": ["event", "summary", "alarm"],
+    "min_alarm": 0,
+    "thumbnail": True,
+}
 
 
 st.set_page_config(layout="wide")
@@ -24,60 +33,181 @@ st.set_page_config(layout="wide")
 st.title("SenseAct AI 实时感知")
 
 
+class MessageStore:
+    """
+    当前会话的消息窗口，WebSocket 线程写入，页面脚本读取。
+    只保留最新的 size 条，total 为收到的消息总数，页面按它判断有哪些新消息。
+    last_seq 为收到的最大序号（不同 worker 的消息可能乱序到达）；
+    重连补发的消息可能已经收到过，按序号去重，记录最近 size * 2 个序号。
+    """
+
+    def __init__(self, size: int = WebUIConfig.WINDOW_SIZE):
+        self.messages = deque(maxlen=size)
+        self.total = 0
+        self.last_seq = None
+        self.seen = OrderedDict()
+        self.seen_size = size * 2
+        self.changed = threading.Condition()
+
+    def add(self, msg: dict) -> bool:
+        """加入一条消息，已收到过的序号返回 False。"""
+        seq = msg.get("seq")
+        with self.changed:
+            if seq is not None:
+                if seq in self.seen:
+                    return False
+                self.seen[seq] = None
+                while len(self.seen) > self.seen_size:
+                    self.seen.popitem(last=False)
+                self.last_seq = seq if self.last_seq is None else max(self.last_seq, seq)
+            self.messages.append(msg)
+            self.total += 1
+            self.changed.notify_all()
+            return True
+
+    def since(self, total: int):
+        """返回 (当前 total, 第 total 条之后仍在窗口中的消息)。"""
+        with self.changed:
+            count = min(self.total - total, len(self.messages))
+            messages = list(self.messages)[len(self.messages) - count:]
+            return self.total, messages
+
+    def wait(self, total: int, timeout: float) -> bool:
+        """等待第 total 条之后的新消息，超时返回 False。"""
+        with self.changed:
+            return self.changed.wait_for(lambda: self.total > total, timeout)
+
+
+class ThumbnailCache:
+    """解码后的缩略图（LRU），按 blob_store 哈希缓存，没有哈希的按 data URI 的 sha1。所有会话共用。"""
+
+    def __init__(self, size: int = WebUIConfig.THUMBNAIL_CACHE_SIZE):
+        self.size = size
+        self.images = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self.lock:
+            data = self.images.get(key)
+            if data is not None:
+                self.images.move_to_end(key)
+                return data
+        if key.startswith("sha1:"):
+            return None
+        # 已被淘汰的缩略图从 blob_store 重新读取
+        data = blob_store.load(key)
+        if data is not None:
+            self.put(key, data)
+        return data
+
+    def put(self, key, data: bytes):
+        with self.lock:
+            self.images[key] = data
+            self.images.move_to_end(key)
+            while len(self.images) > self.size:
+                self.images.popitem(last=False)
+
+    def add(self, ref=None, data_uri=None):
+        """
+        登记一张缩略图并返回缓存键，相同的图片只解码一次。
+        ref 为 thumbnail 列的值（blob_store 哈希，旧数据中是 data URI），data_uri 为随消息送达的图片。
+        """
+        if ref and ref.startswith("data:"):
+            ref, data_uri = None, ref
+        key = ref
+        if key is None and data_uri:
+            key = "sha1:" + hashlib.sha1(data_uri.encode("utf-8")).hexdigest()
+        if key is None:
+            return None
+        with self.lock:
+            cached = key in self.images
+        if not cached and data_uri:
+            data = blob_store.load(data_uri)
+            if data is not None:
+                self.put(key, data)
+        return key
+
+
+@st.cache_resource
+def get_thumbnail_cache() -> ThumbnailCache:
+    return ThumbnailCache()
+
+
+thumbnails = get_thumbnail_cache()
+
 # --- Streamlit Session State Initialization ---
 # Initialize session state variables
-if "message_queue" not in st.session_state:
-    st.session_state.message_queue = queue.Queue(maxsize=10)
+if "store" not in st.session_state:
+    st.session_state.store = MessageStore()
 
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if "history_pages" not in st.session_state:
+    st.session_state.history_pages = 0
 
 if "websocket_thread" not in st.session_state:
     st.session_state.websocket_thread = None
 
 # ---------------------------------------------
 
-def on_message(ws, message):
-    data = json.loads(message)
-    print(data)
-    #st.session_state.message_queue.put(data)
-    st.session_state.messages.append(data)
+def run_websocket(store: MessageStore):
+    # 回调在 WebSocket 线程中执行，只通过 store 与页面交换数据，不访问 st.session_state
+    def on_message(ws, message):
+        data = json.loads(message)
+        print(f"Received {data.get('type')} #{data.get('seq')} from {data.get('device_id')}")
+        # 收到时解码缩略图并丢弃 base64 文本，窗口中只保留缓存键
+        data["thumbnail_key"] = thumbnails.add(data.get("thumbnail_hash"), data.pop("thumbnail", None))
+        store.add(data)
 
-def on_error(ws, error):
-    print(f"WebSocket Error: {error}")
+    def on_error(ws, error):
+        print(f"WebSocket Error: {error}")
 
-def on_close(ws, close_status_code, close_msg):
-    print("WebSocket connection closed")
+    def on_close(ws, close_status_code, close_msg):
+        print("WebSocket connection closed")
 
-def on_open(ws):
-    ws.send('{"userKey": "<YOUR_KEY>"}')
+    def on_open(ws):
+        # 重连时带上收到的最后一条消息的序号，服务端补发断开期间的消息
+        ws.send(json.dumps(dict(SUBSCRIPTION, last_seq=store.last_seq)))
 
-def run_websocket():
     ws = websocket.WebSocketApp(
         WEBSOCKET_URL,
         on_message=on_message,
         on_error=on_error,
         on_close=on_close
     )
-    ws.on_open = on_open    
+    ws.on_open = on_open
     print("WebSocket thread started")
-    ws.run_forever()
+    # 断开后 5 秒自动重连
+    ws.run_forever(reconnect=5)
 
 
 if st.session_state.websocket_thread is None or not st.session_state.websocket_thread.is_alive():
     print("Starting WebSocket connection...")
-    websocket_thread = threading.Thread(target=run_websocket, daemon=True)
-    add_script_run_ctx(websocket_thread)
+    websocket_thread = threading.Thread(target=run_websocket, args=(st.session_state.store,), daemon=True)
     websocket_thread.start()
     st.session_state.websocket_thread = websocket_thread
 
 
-def decode_base64_image(b64_str: str) -> bytes:
-    # 如果包含 data URI 前缀，就去掉它
-    if ',' in b64_str:
-        b64_str = b64_str.split(',', 1)[1]
-    # 解码成原始二进制
-    return base64.b64decode(b64_str)  # :contentReference[oaicite:0]{index=0}
+def load_history(before: int, limit: int) -> list:
+    """
+    从数据库按时间倒序读取早于 before 的事件，返回按时间正序排列的消息。
+    数据库还不存在（视频服务尚未写入）时返回空列表，不创建空库。
+    """
+    if not os.path.exists(DBConfig.PATH):
+        return []
+    conn = database.connect(DBConfig.PATH)
+    try:
+        # 旧数据库可能还没有 timestamp 索引，先补齐表结构
+        database.migrate(conn)
+        rows = database.EventQueries(conn).recent(before, limit)
+    finally:
+        conn.close()
+    messages = []
+    for device_id, timestamp, thumbnail, description, event_catagory, triger_alarm in reversed(rows):
+        messages.append(dict(type="event", device_id=device_id, timestamp=timestamp,
+                             thumbnail_key=thumbnails.add(thumbnail), description=description,
+                             event_catagory=event_catagory, triger_alarm=triger_alarm or 0))
+    return messages
 
 
 LEVELS = {
@@ -95,65 +225,83 @@ def set_level(triger_alarm):
     # stars = LEVELS["star"] * int(triger_alarm * 10/2)
     return LEVELS[level]
 
+def render_card(msg):
+    # 卡片容器
+    with st.container(border=True):
+        # 两列布局：缩略图 + 描述
+        col1, col2 = st.columns([1, 3], gap="small")
+        with col1:
+            raw_bytes = thumbnails.get(msg.get("thumbnail_key"))
+            if raw_bytes:
+                st.image(raw_bytes, width=400, caption=None)
+            else:
+                st.markdown("— 无缩略图 —")
+        with col2:
+            if msg.get("type") == "event":
+                ts = timestamp_to_str(msg['timestamp'],style="simple")
+                st.markdown(f'<span class="timestamp">{ts}</span>', unsafe_allow_html=True)
+                level = set_level(msg["triger_alarm"])
+                title = msg["event_catagory"]
+                st.markdown(f"{level} **{title}**")
+                st.markdown(msg["description"])
+            
+            elif msg.get("type") == "summary":
+                #st.markdown("<div class='summary'>",unsafe_allow_html=True)
+                ts_start = timestamp_to_str(msg['start_timestamp'],style="simple")
+                ts_end = timestamp_to_str(msg['end_timestamp'],style="simple")
+                st.markdown(f'<span class="timestamp">{ts_start}</span> -- <span class="timestamp">{ts_end}</span>',
+                             unsafe_allow_html=True)
+                title = msg["title"]
+                st.markdown(f"**{title}**")
+                st.markdown(msg["description"])
+            
+                with st.popover("查看事件详情"):
+                    for ev in msg["events"]:
+                        ev_ts = timestamp_to_str(ev["timestamp"],style="simple")
+                        level = set_level(ev["triger_alarm"])
+                        title = ev["event_catagory"]
+                        st.markdown(f"")
+                        st.markdown(f"{ev_ts} — {level} **{title}** {ev['description']}")
+                #st.markdown("</div>",unsafe_allow_html=True)
+            else:
+                st.markdown(msg["description"])
+
+
+
 def render(messages):
-    for i,msg in enumerate(messages):
-        
-        # 卡片容器
-        with st.container(border=True):        
-            # 两列布局：缩略图 + 描述
-            col1, col2 = st.columns([1, 3], gap="small")
-            with col1:
-                if msg.get("thumbnail"):
-                    raw_bytes = decode_base64_image(msg["thumbnail"])
-                    bytes_io = io.BytesIO(raw_bytes) 
-                    st.image(bytes_io, width=400, caption=None) 
-                else:
-                    st.markdown("— 无缩略图 —")
-            with col2:
-                if msg.get("type") == "event":
-                    ts = timestamp_to_str(msg['timestamp'],style="simple")
-                    st.markdown(f'<span class="timestamp">{ts}</span>', unsafe_allow_html=True)
-                    level = set_level(msg["triger_alarm"])
-                    title = msg["event_catagory"]
-                    st.markdown(f"{level} **{title}**")
-                    st.markdown(msg["description"])
-                
-                elif msg.get("type") == "summary":
-                    #st.markdown("<div class='summary'>",unsafe_allow_html=True)
-                    ts_start = timestamp_to_str(msg['start_timestamp'],style="simple")
-                    ts_end = timestamp_to_str(msg['end_timestamp'],style="simple")
-                    st.markdown(f'<span class="timestamp">{ts_start}</span> -- <span class="timestamp">{ts_end}</span>',
-                                 unsafe_allow_html=True)
-                    title = msg["title"]
-                    st.markdown(f"**{title}**")
-                    st.markdown(msg["description"])
-                
-                    with st.popover("查看事件详情"):
-                        for ev in msg["events"]:
-                            ev_ts = timestamp_to_str(ev["timestamp"],style="simple")
-                            level = set_level(ev["triger_alarm"])
-                            title = ev["event_catagory"]
-                            st.markdown(f"")
-                            st.markdown(f"{ev_ts} — {level} **{title}** {ev['description']}")
-                    #st.markdown("</div>",unsafe_allow_html=True)
-                else:
-                    st.markdown(msg["description"])
-
-
-
-# st.json(st.session_state.messages)
-
-# while True:
-# # while not st.session_state.message_queue.empty():
-#     while st.session_state.messages:
-#         #message = st.session_state.message_queue.get()
-#         #st.session_state.messages.append(message)
-#         # Function to render messages in time order
-
-with st.container():
-    render(st.session_state.messages)
-
-time.sleep(2)
-
-st.rerun()
-    
\ No newline at end of file
+    for msg in messages:
+        render_card(msg)
+
+
+store = st.session_state.store
+
+# 更早的消息不在内存中，点击后按页从数据库加载
+history = st.container()
+live = st.container()
+status = st.empty()
+
+total, window = store.since(0)
+with history:
+    if st.button("加载更早的事件"):
+        st.session_state.history_pages += 1
+    if st.session_state.history_pages:
+        before = min((msg["timestamp"] for msg in window if "timestamp" in msg), default=2 ** 62)
+        render(load_history(before, st.session_state.history_pages * WebUIConfig.PAGE_SIZE))
+
+with live:
+    render(window)
+shown = len(window)
+
+# 由 WebSocket 线程的新消息唤醒，只把新到的卡片追加到页面，已显示的卡片不重绘。
+# 页面上的卡片超过窗口的两倍时整页重建，只保留最新的窗口；
+# 每次等待超时都会更新状态行，用户操作（如加载历史）能及时打断这个循环。
+while True:
+    status.caption(f"已接收 {store.total} 条消息，内存中保留最新 {len(store.messages)} 条")
+    if not store.wait(total, WebUIConfig.WAIT_TIMEOUT):
+        continue
+    total, new_messages = store.since(total)
+    if shown + len(new_messages) > 2 * WebUIConfig.WINDOW_SIZE:
+        st.rerun()
+    with live:
+        render(new_messages)
+    shown += len(new_messages)